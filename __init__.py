@@ -1,8 +1,12 @@
 from .src.bgraph import bGraph
 from .src.book import Book
+from .src.completioncache import CompletionCache
 from .src.consts import *
 from .src.nxwordgraph import WordGraph
+from .src.pdbmirror import PdbMirror, ResponseCache
 from .src.pdbwrangler import PdbWrangler
-from .src.poem import Poem
+from .src.poem import LeanPoem, Poem
 from .src.poet import Poet
+from .src.simindex import SimIndex
+from .src.syncache import SynCache
 from .src.syngraph import SynGraph
@@ -2,16 +2,36 @@
 A discord bot that writes short poems in the style of Matsuo Basho.
 
 When a message begins with PREFIX, message content is passed to a Poet
-object that generates a short poem. The bot is very simple and does not log
-exceptions.
+object that generates a short poem. Poems are generated asynchronously, so a
+slow completion does not hold up messages from other channels.
+
+Messages, prompts, completions and formatting are timed with the spans of
+metrics.py. If METRICS_PORT is set, the metrics are served at
+http://127.0.0.1:METRICS_PORT/metrics, and if METRICS_LOG is set, they are
+logged every METRICS_LOG seconds.
 """
 from basho.src.poet import Poet
 from basho.src.consts import *
+from basho.src import metrics
+import asyncio
 import json
+import logging
 import discord
 
+logger = logging.getLogger(__name__)
 client = discord.Client()
 basho = Poet(HEADER, CORPUS)
+_monitor = None
+
+
+@client.event
+async def on_ready():
+    """
+    Starts measuring the event loop, once (on_ready runs on every reconnect).
+    """
+    global _monitor
+    if _monitor is None:
+        _monitor = asyncio.ensure_future(metrics.monitor_loop())
 
 
 @client.event
@@ -28,12 +48,15 @@ async def on_message(message):
     if message.content.startswith(PREFIX) and len(message.content) < 50:
         seed = message.content[2:]
         try:
-            poem = format_poem(basho.generate(SIZE, seed))
-            await message.channel.send(poem)
-        except:
+            with metrics.span("message"):
+                poem = format_poem(await basho.agenerate(SIZE, seed))
+                await message.channel.send(poem)
+        except Exception:
+            logger.exception("Could not write a poem for %r", seed)
             await message.channel.send("Try again, {}.".format(message.author.mention))
 
 
+@metrics.timed("format_poem")
 def format_poem(poem):
     """
     Formats the poem.
@@ -49,4 +72,9 @@ def format_poem(poem):
     return text
 
 
+if METRICS_PORT:
+    metrics.serve(int(METRICS_PORT))
+if METRICS_LOG:
+    logging.basicConfig(level=logging.INFO)
+    metrics.log_every(float(METRICS_LOG), logger)
 client.run(TOKEN)
@@ -0,0 +1,363 @@
+"""
+A benchmark harness for basho's hot paths.
+
+Benchmarks run on synthetic corpora in the shape of basho_corpus.json (a json
+object of {seed: poem} with lines separated by "/"), generated from a seed so
+runs are reproducible. WordNet is replaced by a synthetic SynCache and OpenAI
+by a StubServer, so nothing touches the network. For every hot path the
+harness reports throughput, latency percentiles and peak traced memory, and
+writes the results to a json file that later runs can be compared against:
+
+    python -m basho.src.bench --sizes 1000 10000 --out before.json
+    python -m basho.src.bench --sizes 1000 10000 --compare before.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# Each benchmark: name -> (function of (corpus, options) returning a list of
+# zero-argument operations, or a tuple (operations, cleanup function),
+# description)
+BENCHMARKS = {}
+
+
+def benchmark(name, description):
+    """
+    Registers a function as a benchmark. The function takes the corpus and
+    the options and returns a list of operations, each timed separately.
+    """
+    def register(func):
+        BENCHMARKS[name] = (func, description)
+        return func
+    return register
+
+
+def synthetic_corpus(size, seed=0, vocab=2000, lines=3, words=(2, 5)):
+    """
+    Returns a dictionary of size {seed: poem} pairs in the shape of
+    basho_corpus.json. Words are drawn from a Zipf-like distribution, so
+    some are common and most are rare, as in real poems.
+
+    Parameter size: the number of poems.
+    Precondition: size is a positive int.
+    Parameter seed: the seed of the generator.
+    Precondition: seed is an int.
+    Parameter vocab: the number of distinct words.
+    Precondition: vocab is a positive int.
+    Parameter lines: the number of lines of every poem.
+    Precondition: lines is a positive int.
+    Parameter words: the smallest and largest number of words in a line.
+    Precondition: words is a pair of positive ints.
+    """
+    rng = random.Random(seed)
+    names = ["w{}".format(i) for i in range(vocab)]
+    weights = [1 / (rank + 1) for rank in range(vocab)]
+    corpus = {}
+    while len(corpus) < size:
+        key = "{} {}".format(rng.choices(names, weights)[0], len(corpus))
+        poem = "/".join(" ".join(rng.choices(names, weights,
+                                             k=rng.randint(*words)))
+                        for line in range(lines))
+        corpus[key] = poem
+    return corpus
+
+
+def write_corpus(corpus, path):
+    """
+    Writes a synthetic corpus to path as json, like basho_corpus.json.
+    """
+    with open(path, "w") as file:
+        json.dump(corpus, file)
+
+
+def synthetic_cache(corpus, seed=0, synsets=200):
+    """
+    Returns a SynCache holding a synthetic WordNet entry for every word in
+    corpus, so SynGraphs can be built without WordNet.
+    """
+    from basho.src.syncache import SynCache
+    rng = random.Random(seed)
+    words = {w for poem in corpus.values()
+             for w in poem.replace("/", " ").split()}
+    names = ["s{}.n.01".format(i) for i in range(synsets)]
+    entries = {}
+    for word in words:
+        hyper = tuple(rng.sample(names, rng.randint(0, 3)))
+        hypo = tuple(rng.sample(names, rng.randint(0, 3)))
+        entries[word] = ((word + ".n.01",), hyper, hypo)
+    cache = SynCache(size=len(entries) + 1)
+    cache.update(entries)
+    return cache
+
+
+def _poems(corpus, limit=None):
+    from basho.src.poem import Poem
+    items = list(corpus.items())[:limit]
+    return [Poem(text, label=key) for key, text in items]
+
+
+@benchmark("wordgraph", "WordGraph of the whole corpus")
+def _wordgraph(corpus, options):
+    from basho.src.nxwordgraph import WordGraph
+    poems = _poems(corpus)
+    return [lambda: WordGraph(poems)]
+
+
+@benchmark("syngraph", "SynGraph of one Poem")
+def _syngraph(corpus, options):
+    from basho.src.syngraph import SynGraph
+    cache = synthetic_cache(corpus)
+    poems = _poems(corpus, options["ops"])
+    return [lambda p=p: SynGraph.from_poem(p, cache=cache) for p in poems]
+
+
+@benchmark("ged", "graph_edit_distance of a small Book")
+def _ged(corpus, options):
+    from basho.src.book import Book
+    from basho.src import syncache
+    cache = synthetic_cache(corpus)
+    book = Book.from_poems(_poems(corpus, options["ged"]))
+    previous = syncache.get_cache()
+
+    def run():
+        syncache.set_cache(cache)
+        try:
+            book.graph_edit_distance(gen=True, time=1, workers=1)
+        finally:
+            syncache.set_cache(previous)
+    return [run]
+
+
+@benchmark("build_prompt", "Poet.build_prompt of SIZE examples")
+def _build_prompt(corpus, options):
+    poet = _poet(corpus)
+    return [lambda: poet.build_prompt(options["size"], poet.corpus,
+                                      poet.header)
+            for i in range(options["ops"])]
+
+
+@benchmark("random_keys", "Poet.random_keys of SIZE keys")
+def _random_keys(corpus, options):
+    from basho.src.poet import Poet
+    return [lambda: Poet.random_keys(options["size"], corpus)
+            for i in range(options["ops"])]
+
+
+@benchmark("to_poem", "PdbWrangler._to_poem of a PoetryDB response")
+def _to_poem(corpus, options):
+    from basho.src.pdbwrangler import PdbWrangler
+    wrangler = PdbWrangler()
+    response = [{"title": key, "author": "synthetic",
+                 "lines": text.split("/"),
+                 "linecount": str(text.count("/") + 1)}
+                for key, text in corpus.items()]
+    batch = 100
+    chunks = [response[i:i + batch] for i in range(0, len(response), batch)]
+    return [lambda c=c: wrangler._to_poem(c, d=" % ")
+            for c in chunks[:options["ops"]]]
+
+
+@benchmark("generate", "Poet.agenerate against a stub completion server")
+def _generate(corpus, options):
+    from basho.src.completion import AsyncCompletions
+    from basho.src.stubserver import StubServer
+    poet = _poet(corpus)
+    stub = StubServer(delay=options["delay"]).start()
+    loop = asyncio.new_event_loop()
+    poet.client = AsyncCompletions(api_base=stub.url, api_key="stub")
+    seeds = list(corpus)[:options["ops"]]
+
+    def cleanup():
+        loop.run_until_complete(poet.client.close())
+        loop.close()
+        stub.stop()
+    return ([lambda s=s: loop.run_until_complete(
+        poet.agenerate(options["size"], s)) for s in seeds], cleanup)
+
+
+def _poet(corpus):
+    from basho.src.poet import Poet
+    return Poet("Writes synthetic poems", corpus)
+
+
+def measure(ops, memory=True):
+    """
+    Runs a list of operations, and returns a dictionary of their count, total
+    seconds, throughput (operations per second), latency percentiles in
+    milliseconds, and (if memory is True) the largest peak traced memory in
+    MB of any operation, from a second run of every operation. Statistics of
+    an empty list are None.
+    """
+    if not ops:
+        result = {"ops": 0, "seconds": 0.0, "throughput": None}
+        result.update((stat, None) for stat in ("mean_ms", "p50_ms", "p90_ms",
+                                                "p99_ms", "max_ms"))
+        if memory:
+            result["peak_mb"] = None
+        return result
+    latencies = []
+    gc.collect()
+    start = time.perf_counter()
+    for op in ops:
+        t = time.perf_counter()
+        op()
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    result = {"ops": len(ops), "seconds": total,
+              "throughput": len(ops) / total if total else None,
+              "mean_ms": float(ms.mean()),
+              "p50_ms": float(np.percentile(ms, 50)),
+              "p90_ms": float(np.percentile(ms, 90)),
+              "p99_ms": float(np.percentile(ms, 99)),
+              "max_ms": float(ms.max())}
+    if memory:
+        # Tracing slows Python down, so memory is measured separately
+        gc.collect()
+        tracemalloc.start()
+        peak = 0
+        for op in ops:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+        result["peak_mb"] = peak / 2 ** 20
+    return result
+
+
+def run(sizes=(1000,), names=None, seed=0, ops=200, size=5, ged=8,
+        delay=0.0, memory=True, out=sys.stdout):
+    """
+    Runs benchmarks on synthetic corpora and returns the results as a
+    json-serializable dictionary.
+
+    Parameter sizes: the numbers of poems in the corpora.
+    Precondition: sizes is an iterable of positive ints.
+    Parameter names: the benchmarks to run (None for all of BENCHMARKS).
+    Precondition: names is a list of strings or None.
+    Parameter seed: the seed of the corpora.
+    Precondition: seed is an int.
+    Parameter ops: the number of operations of per-item benchmarks.
+    Precondition: ops is a positive int.
+    Parameter size: the number of examples in a prompt.
+    Precondition: size is a positive int.
+    Parameter ged: the number of Poems in the graph edit distance Book.
+    Precondition: ged is a positive int.
+    Parameter delay: the latency in seconds of the stub server.
+    Precondition: delay is a number.
+    Parameter memory: Whether to measure peak memory.
+    Precondition: memory is a bool.
+    Parameter out: where progress is written (None for nowhere).
+    Precondition: out is a file or None.
+    """
+    options = {"ops": ops, "size": size, "ged": ged, "delay": delay}
+    results = []
+    for n in sizes:
+        corpus = synthetic_corpus(n, seed)
+        for name in names or list(BENCHMARKS):
+            func, description = BENCHMARKS[name]
+            operations = func(corpus, options)
+            cleanup = None
+            if isinstance(operations, tuple):
+                operations, cleanup = operations
+            try:
+                result = measure(operations, memory)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+            result.update({"name": name, "corpus": n})
+            results.append(result)
+            if out is not None:
+                out.write("{:>14} {:>9} {:>10}/s p50 {:>9} ms "
+                          "p99 {:>9} ms {:>8} MB\n".format(
+                              name, n, _fmt(result["throughput"], 1),
+                              _fmt(result["p50_ms"], 3),
+                              _fmt(result["p99_ms"], 3),
+                              _fmt(result.get("peak_mb"), 1)))
+    return {"meta": {"python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "seed": seed, "options": options},
+            "results": results}
+
+
+def _fmt(value, digits):
+    """
+    Returns value with digits decimals, or "-" if it is None.
+    """
+    if value is None:
+        return "-"
+    return "{:.{}f}".format(value, digits)
+
+
+def compare(old, new, out=sys.stdout):
+    """
+    Writes the change in p50 latency, throughput and peak memory of every
+    benchmark in new relative to old, and returns them as a list of
+    (name, corpus size, latency ratio, throughput ratio, memory ratio).
+
+    Parameter old, new: results returned by run() (or loaded from json).
+    Precondition: old and new are dictionaries.
+    """
+    before = {(r["name"], r["corpus"]): r for r in old["results"]}
+    rows = []
+    for r in new["results"]:
+        b = before.get((r["name"], r["corpus"]))
+        if b is None:
+            continue
+        ratios = [_ratio(r["p50_ms"], b["p50_ms"]),
+                  _ratio(r["throughput"], b["throughput"]),
+                  _ratio(r.get("peak_mb"), b.get("peak_mb"))]
+        rows.append((r["name"], r["corpus"]) + tuple(ratios))
+        if out is not None:
+            out.write("{:>14} {:>9}  p50 x{}  throughput x{}  memory x{}\n"
+                      .format(r["name"], r["corpus"],
+                              *("{:.2f}".format(x) if x is not None else "-"
+                                for x in ratios)))
+    return rows
+
+
+def _ratio(a, b):
+    if a is None or not b:
+        return None
+    return a / b
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--ged", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--out", help="write the results to this json file")
+    parser.add_argument("--compare", help="compare with this results file")
+    parser.add_argument("--corpus", help="only write a synthetic corpus of "
+                        "the first size to this json file")
+    args = parser.parse_args(argv)
+    if args.corpus:
+        write_corpus(synthetic_corpus(args.sizes[0], args.seed), args.corpus)
+        return
+    results = run(args.sizes, args.only, args.seed, args.ops, args.size,
+                  args.ged, args.delay, not args.no_memory)
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
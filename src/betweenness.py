@@ -0,0 +1,142 @@
+"""
+Exact, parallel and approximate betweenness centrality.
+
+Betweenness is a sum over source nodes of how often each node lies on the
+shortest paths from that source, so the sources can be split across worker
+processes and the partial sums added up. Summing over a random sample of k
+sources instead, scaled by n/k, gives an unbiased estimate in O(k·E) time, and
+the spread of the per-source contributions gives its standard error.
+
+Results are computed without normalization and scaled as networkx does, so
+with every source they equal networkx.betweenness_centrality().
+"""
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import networkx.algorithms as algs
+import numpy as np
+
+# The graph and node order of a worker process, set once by _init_worker.
+_graph = None
+_nodes = []
+
+
+def _init_worker(graph):
+    """
+    Stores the graph in a worker process.
+    """
+    global _graph, _nodes
+    _graph = graph
+    _nodes = list(graph)
+
+
+def _partial(sources, squares=False):
+    """
+    Returns a tuple (sums, squares) of arrays, in the order of the graph's
+    nodes, of the betweenness contributions of sources and (if squares is
+    True, else None) the sums of their squares.
+    """
+    targets = _nodes
+    if not squares:
+        values = algs.betweenness_centrality_subset(_graph, sources, targets,
+                                                    normalized=False)
+        return np.array([values[v] for v in _nodes]), None
+    sums = np.zeros(len(_nodes))
+    sq = np.zeros(len(_nodes))
+    for source in sources:
+        values = algs.betweenness_centrality_subset(_graph, [source], targets,
+                                                    normalized=False)
+        contribution = np.array([values[v] for v in _nodes])
+        sums += contribution
+        sq += contribution ** 2
+    return sums, sq
+
+
+def _scale(g, normalized):
+    """
+    Returns the factor networkx scales unnormalized betweenness by.
+    """
+    n = g.number_of_nodes()
+    if not normalized or n <= 2:
+        return 1.0
+    if g.is_directed():
+        return 1.0 / ((n - 1) * (n - 2))
+    return 2.0 / ((n - 1) * (n - 2))
+
+
+def compute(g, normalized=True, k=None, seed=None, workers=1):
+    """
+    Returns a tuple (values, errors) of dictionaries of {node: betweenness}
+    and {node: standard error} for g. errors is None if every source was
+    used.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    Parameter normalized: Whether betweenness is normalized.
+    Precondition: normalized is a bool.
+    Parameter k: the number of sampled sources (None for every node).
+    Precondition: k is a positive int or None.
+    Parameter seed: the seed of the sample.
+    Precondition: seed is an int, a random.Random or None.
+    Parameter workers: the number of worker processes (None for one per
+    CPU, 1 to compute in this process).
+    Precondition: workers is a positive int or None.
+    """
+    nodes = list(g)
+    n = len(nodes)
+    sampled = k is not None and k < n
+    if sampled:
+        rng = seed if isinstance(seed, random.Random) else random.Random(seed)
+        sources = rng.sample(nodes, k)
+    else:
+        sources = nodes
+    workers = workers or os.cpu_count() or 1
+    sums = np.zeros(n)
+    squares = np.zeros(n)
+    if workers == 1 or len(sources) < 2:
+        _init_worker(g)
+        parts = [_partial(sources, sampled)]
+    else:
+        chunks = [sources[i::4 * workers] for i in range(4 * workers)]
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(g,)) as pool:
+            parts = list(pool.map(_partial, [c for c in chunks if c],
+                                  [sampled] * len(chunks)))
+    for part_sums, part_squares in parts:
+        sums += part_sums
+        if sampled:
+            squares += part_squares
+    scale = _scale(g, normalized)
+    if not sampled:
+        return dict(zip(nodes, (sums * scale).tolist())), None
+    mean = sums / k
+    variance = np.maximum(squares / k - mean ** 2, 0.0)
+    if k > 1:
+        variance *= k / (k - 1)
+    # The sample is drawn without replacement, hence the finite population
+    # correction
+    errors = n * np.sqrt(variance / k) * math.sqrt((n - k) / (n - 1))
+    return (dict(zip(nodes, (n * mean * scale).tolist())),
+            dict(zip(nodes, (errors * scale).tolist())))
+
+
+def fingerprint(g):
+    """
+    Returns a value that changes whenever nodes or edges of g are added or
+    removed, computed in O(V + E) time.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    """
+    mask = (1 << 64) - 1
+    nodes = 0
+    for node in g:
+        nodes = (nodes + hash(node)) & mask
+    edges = 0
+    directed = g.is_directed()
+    for u, v in g.edges():
+        edge = (u, v) if directed else frozenset((u, v))
+        edges = (edges + hash(edge)) & mask
+    return (g.number_of_nodes(), g.number_of_edges(), nodes, edges)
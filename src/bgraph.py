@@ -1,4 +1,7 @@
 import networkx as nx
+import numpy as np
+from basho.src import betweenness as bc
+from basho.src import graphio
 
 
 class bGraph(object):
@@ -12,6 +15,22 @@ class bGraph(object):
         """
         self._g = nx.Graph()
 
+    @property
+    def _g(self):
+        """
+        The networkx graph. Graphs opened by load() build it from their
+        memory-mapped arrays on first access.
+        """
+        arrays = self.__dict__.pop("_pending", None)
+        if arrays is not None:
+            self._nx = _build(arrays)
+        return self._nx
+
+    @_g.setter
+    def _g(self, g):
+        self.__dict__.pop("_pending", None)
+        self._nx = g
+
     def get_graph(self):
         return self._g
 
@@ -36,10 +55,41 @@ class bGraph(object):
         """
         nx.write_gexf(self._g, name)
 
+    def save(self, path):
+        """
+        Writes the graph to path in basho's binary graph format, which
+        load() reads back far faster than the graph can be rebuilt.
+
+        Parameter path: the filename or path
+        Precondition: path is a string.
+        """
+        graphio.save(self.to_arrays(), path, type(self).__name__)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Returns the graph saved to path by save().
+
+        Parameter path: the filename or path
+        Precondition: path is a string, and the graph saved there is of this
+        class (or cls is bGraph).
+        Parameter mmap: Whether the file is memory-mapped and the networkx
+        graph only built when it is first used (True), or read and built now
+        (False).
+        Precondition: mmap is a bool.
+        """
+        kind, arrays = graphio.load(path, mmap)
+        if cls is not bGraph and kind != cls.__name__:
+            raise Exception("{} holds a {}, not a {}."
+                            .format(path, kind, cls.__name__))
+        return cls.from_arrays(arrays, lazy=mmap)
+
     def get_num_nodes(self):
         """
         Returns the number of nodes in the Graph.
         """
+        if "_pending" in self.__dict__:
+            return len(self._pending["nodes"])
         return self._g.number_of_nodes()
 
     def is_directed(self):
@@ -47,3 +97,135 @@ class bGraph(object):
         Return True if the graph is directed, False otherwise.
         """
         return self._g.is_directed()
+
+    def betweenness(self, normalized=True, k=None, seed=None, workers=1,
+                    errors=False):
+        """
+        Returns a dictionary of {node: betweenness centrality} for the graph.
+
+        With k, betweenness is estimated from k sampled source nodes. With
+        workers, sources are split across processes. Results are cached, and
+        are only recomputed once nodes or edges have been added or removed
+        (or if k is given without an int seed).
+
+        Parameter normalized: Whether betweenness is normalized.
+        Precondition: normalized is a bool.
+        Parameter k: the number of sampled sources (None for exact).
+        Precondition: k is a positive int or None.
+        Parameter seed: the seed of the sample.
+        Precondition: seed is an int or None.
+        Parameter workers: the number of worker processes (None for one per
+        CPU).
+        Precondition: workers is a positive int or None.
+        Parameter errors: Whether to return a tuple (values, standard errors)
+        instead, where the errors are None for exact betweenness.
+        Precondition: errors is a bool.
+        """
+        cache = getattr(self, "_betweenness", None)
+        if cache is None:
+            cache = self._betweenness = {}
+        params = (normalized, k, seed)
+        current = bc.fingerprint(self._g)
+        entry = cache.get(params)
+        if entry is None or entry[0] != current:
+            values, stderr = bc.compute(self._g, normalized=normalized, k=k,
+                                        seed=seed, workers=workers)
+            entry = (current, values, stderr)
+            if k is None or isinstance(seed, int):
+                cache[params] = entry
+        if errors:
+            return entry[1], entry[2]
+        return entry[1]
+
+    def to_arrays(self):
+        """
+        Returns the graph as a dictionary of plain arrays, which is far
+        cheaper to pickle (e.g. between processes) than a networkx graph.
+
+        Nodes are numbered by their position in the "nodes" list, and "edges"
+        is an (m, 2) int32 array of node numbers. "node_attrs" and
+        "edge_attrs" map attribute names to a value per node or edge: a NumPy
+        array for numbers, otherwise a list (with None where a node or edge
+        lacks the attribute).
+        """
+        nodes = list(self._g)
+        ids = {node: i for i, node in enumerate(nodes)}
+        edges = np.array([(ids[u], ids[v]) for u, v in self._g.edges()],
+                         dtype=np.int32).reshape(-1, 2)
+        return {"directed": self._g.is_directed(), "nodes": nodes,
+                "edges": edges,
+                "node_attrs": _columns(d for n, d in self._g.nodes(data=True)),
+                "edge_attrs": _columns(d for u, v, d in
+                                       self._g.edges(data=True))}
+
+    @classmethod
+    def from_arrays(cls, arrays, lazy=False):
+        """
+        Returns a graph of this class rebuilt from the output of to_arrays().
+
+        Parameter arrays: the arrays of a graph.
+        Precondition: arrays is a dictionary returned by to_arrays().
+        Parameter lazy: Whether the networkx graph is only built when it is
+        first used.
+        Precondition: lazy is a bool.
+        """
+        graph = cls.__new__(cls)
+        if lazy:
+            graph._pending = arrays
+        else:
+            graph._g = _build(arrays)
+        return graph
+
+
+def _build(arrays):
+    """
+    Returns the networkx graph of the output of to_arrays().
+    """
+    g = nx.DiGraph() if arrays["directed"] else nx.Graph()
+    nodes = arrays["nodes"]
+    g.add_nodes_from(zip(nodes, _rows(arrays["node_attrs"], len(nodes))))
+    edges = arrays["edges"]
+    g.add_edges_from(zip(map(nodes.__getitem__, edges[:, 0].tolist()),
+                         map(nodes.__getitem__, edges[:, 1].tolist()),
+                         _rows(arrays["edge_attrs"], len(edges))))
+    return g
+
+
+def _columns(dicts):
+    """
+    Returns a dictionary of {name: values} columns for a sequence of
+    attribute dictionaries.
+    """
+    dicts = list(dicts)
+    names = []
+    for d in dicts:
+        for name in d:
+            if name not in names:
+                names.append(name)
+    columns = {}
+    for name in names:
+        values = [d.get(name) for d in dicts]
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool)
+               for v in values):
+            values = np.array(values)
+        columns[name] = values
+    return columns
+
+
+def _rows(columns, length):
+    """
+    Returns an attribute dictionary per row of the columns made by
+    _columns().
+    """
+    if not columns:
+        return [{} for i in range(length)]
+    names = list(columns)
+    values = [v.tolist() if isinstance(v, np.ndarray) else v
+              for v in columns.values()]
+    rows = [dict(zip(names, row)) for row in zip(*values)]
+    for name, column in zip(names, values):
+        if any(value is None for value in column):
+            for row in rows:
+                if row[name] is None:
+                    del row[name]
+    return rows
@@ -1,7 +1,10 @@
-import networkx.algorithms as algs
-import textdistance as td
+import numpy as np
 from pandas import DataFrame
 from basho.src.syngraph import SynGraph
+from basho.src.syncache import get_cache
+from basho.src.columns import COLUMNS, GRAPH_COLUMNS, Columns
+from basho.src.simindex import SimIndex
+from basho.src import distance, ged, graphs, kernels, nlp
 
 
 class Book(object):
@@ -11,6 +14,12 @@ class Book(object):
     Books store these objects in a dictionary, Book.pages. Books can have
     any number or type of attribute set via keyword arguments.
     Book expects values in pages to have a "text" attribute.
+
+    Books also keep NumPy columns of Poem attributes (author, title, label,
+    length, lines, nodes, edges, density, cycles), kept in sync by update().
+    Book.df() returns them as a DataFrame without copying, and filter() and
+    group() work on them directly. Call refresh() after changing Poems in
+    place, e.g. after generating their graphs.
     """
 
     def __init__(self, pages, **kwargs):
@@ -22,6 +31,10 @@ class Book(object):
         """
         self.pages = {key: value for (key, value) in pages.items()}
         self.size = len(self.pages)
+        self._columns = Columns(capacity=max(self.size, 16))
+        for key, value in self.pages.items():
+            self._columns.set(key, value)
+        self._index = None
         for key, value in kwargs.items():
             setattr(self, key, value)
 
@@ -73,59 +86,379 @@ class Book(object):
         Updates the pages dictionary with a {key: value} pair.
         """
         self.pages.update({key: value})
+        self._columns.set(key, value)
+        self.size = len(self.pages)
+        if self._index is not None:
+            self._index.add(key, value)
+
+    def refresh(self, *attributes):
+        """
+        Re-reads columns from the Poems, e.g. after their graphs have been
+        generated.
+
+        Parameter attributes: the columns to re-read. If none are given, the
+        graph columns (nodes, edges, density, cycles) are.
+        Precondition: attributes are column names.
+        """
+        if set(self._columns.keys) != set(self.pages):
+            self._columns = Columns(capacity=max(len(self.pages), 16))
+            attributes = None
+        for key, value in self.pages.items():
+            self._columns.set(key, value, attributes or GRAPH_COLUMNS)
+        self.size = len(self.pages)
+
+    def filter(self, **conditions):
+        """
+        Returns a new Book of the Poems whose columns equal the given values,
+        e.g. book.filter(author="Basho", lines=3).
+
+        Each condition is a vectorized comparison over a whole column.
+
+        Additional keyword arguments are {column: value} conditions.
+        """
+        mask = np.ones(len(self._columns), dtype=bool)
+        for attribute, value in conditions.items():
+            mask &= self._columns.mask(attribute, value)
+        return Book({key: self.pages[key] for key in self._select(mask)})
+
+    def exclude(self, attribute, value):
+        """
+        Returns a list of the keys of Poems whose attribute does not equal
+        value. Columns are compared vectorized; other attributes are read from
+        every Poem.
+        """
+        if attribute in COLUMNS:
+            return self._select(~self._columns.mask(attribute, value))
+        return [key for key, poem in self.pages.items()
+                if getattr(poem, attribute) != value]
+
+    def group(self, by, *attributes):
+        """
+        Returns a pandas GroupBy of the Book's columns, e.g.
+        book.group("author", "length").mean().
+
+        Parameter by: the column to group by.
+        Precondition: by is a column name.
+        Parameter attributes: the columns to keep (all if none are given).
+        Precondition: attributes are column names.
+        """
+        names = None
+        if attributes:
+            names = [by] + [name for name in attributes if name != by]
+        return self._columns.frame(names).groupby(by)
+
+    def build_index(self, index=None, **kwargs):
+        """
+        Builds a SimIndex of the Poems in the Book for similar(), which
+        update() keeps up to date, and returns it.
+
+        Parameter index: an index to reuse, e.g. from SimIndex.load(). Only
+        the Poems missing from it are added.
+        Precondition: index is a SimIndex or None.
+
+        Additional keyword arguments (e.g. num_perm, bands, shingle, syns)
+        are passed to SimIndex when index is None.
+        """
+        if index is None:
+            index = SimIndex(**kwargs)
+        for key, value in self.pages.items():
+            if key not in index:
+                index.add(key, value)
+        self._index = index
+        return index
+
+    def similar(self, item, k=10, rerank=None):
+        """
+        Returns a list of up to k (key, distance) pairs of the Poems in the
+        Book most similar to item, closest first, found through the Book's
+        SimIndex (built with default options if needed).
+
+        Parameter item: a key of the Book, a Poem, or a text.
+        Precondition: item is a key, a Poem or a string.
+        Parameter k: the number of Poems to return.
+        Precondition: k is a positive int.
+        Parameter rerank: the name of a textdistance algorithm with which to
+        re-rank the candidates exactly (None to rank them by estimated
+        Jaccard distance).
+        Precondition: rerank is a string or None.
+        """
+        if self._index is None:
+            self.build_index()
+        exclude = None
+        if isinstance(item, str) and item in self.pages:
+            exclude = item
+            item = self.pages[item]
+        return self._index.query(item, k=k, rerank=rerank, pages=self.pages,
+                                 exclude=exclude)
+
+    def _select(self, mask):
+        """
+        Returns the keys of the rows where mask is True.
+        """
+        keys = self._columns.keys
+        return [keys[i] for i in np.flatnonzero(mask)]
+
+    def warm_syns(self, cache=None):
+        """
+        Looks up the WordNet synsets of every word in the Book, so that
+        SynGraphs of its Poems are built from the cache.
+
+        Parameter cache: the cache to warm (None for the shared cache).
+        Precondition: cache is a SynCache or None.
+        """
+        if cache is None:
+            cache = get_cache()
+        cache.warm_book(self)
+
+    def tag(self, tokenize=True, label=False, workers=None, chunksize=500,
+            progress=False):
+        """
+        Tokenizes and POS-tags every Poem in the Book in batches over a pool
+        of worker processes, each of which loads the tagger once.
+
+        Parameter tokenize: Whether words are tokenized with nltk (True) or
+        split on whitespace (False).
+        Precondition: tokenize is a bool.
+        Parameter label: Whether every Poem is labelled with its first noun,
+        as by Poem.poet_label().
+        Precondition: label is a bool.
+        Parameter workers: the number of worker processes (None for one per
+        CPU, 1 for none).
+        Precondition: workers is a positive int or None.
+        Parameter chunksize: the number of Poems sent to a worker at a time.
+        Precondition: chunksize is a positive int.
+        Parameter progress: True to report progress on stderr, or a function
+        called with the number of Poems done after every chunk.
+        Precondition: progress is a bool or a function.
+        """
+        if progress is True:
+            progress = nlp.report(len(self.pages))
+        pairs = ((key, poem.text) for key, poem in self.pages.items())
+        results = nlp.run(pairs, tokenize=tokenize, workers=workers,
+                          chunksize=chunksize, progress=progress or None)
+        for key, (words, tagged, noun) in results:
+            poem = self.pages[key]
+            poem.set_words(words, tagged)
+            if label and noun is not None:
+                poem.label = noun
+        self.refresh("length", "label")
+
+    def gen_graphs(self, wg=True, sg=True, betweenness=False, cycles=False,
+                   summary=False, workers=None, chunksize=100, cache=None,
+                   **kwargs):
+        """
+        Builds the WordGraphs and/or SynGraphs of every Poem in the Book over
+        a pool of worker processes, and returns a pandas DataFrame of their
+        metrics indexed by key (columns such as wg_nodes, sg_edges,
+        wg_density, wg_cycles and sg_betweenness).
+
+        Unless summary is True, the graphs are also set on the Poems, as by
+        Poem.gen_wg() and Poem.gen_sg(), with a "betweenness" node attribute
+        if betweenness is True, and cycles as by Poem.update_cycles() if
+        cycles is True.
+
+        Parameter wg, sg: Whether to build WordGraphs and SynGraphs.
+        Precondition: wg and sg are bools.
+        Parameter betweenness: Whether to compute betweenness centrality.
+        Precondition: betweenness is a bool.
+        Parameter cycles: Whether to find the cycles of WordGraphs, or a
+        dictionary of bounds for cycles.find(), e.g. {"length": 6,
+        "limit": 10000, "timeout": 5}.
+        Precondition: cycles is a bool or a dictionary.
+        Parameter summary: Whether to keep only the metrics.
+        Precondition: summary is a bool.
+        Parameter workers: the number of worker processes (None for one per
+        CPU, 1 for none).
+        Precondition: workers is a positive int or None.
+        Parameter chunksize: the number of Poems sent to a worker at a time.
+        Precondition: chunksize is a positive int.
+        Parameter cache: the cache of WordNet lookups (None for the shared
+        cache).
+        Precondition: cache is a SynCache or None.
+
+        Additional keyword arguments (e.g. hyp, index, hub) are passed to
+        SynGraph.
+        """
+        kinds = tuple(kind for kind, on in ((graphs.WORD, wg),
+                                            (graphs.SYN, sg)) if on)
+        pairs = ((key, poem.get_words()) for key, poem in self.pages.items())
+        results = graphs.run(pairs, kinds=kinds, betweenness=betweenness,
+                             cycles=cycles, summary=summary, workers=workers,
+                             chunksize=chunksize, cache=cache, **kwargs)
+        rows = {}
+        for key, result in results:
+            if not summary:
+                graphs.attach(self.pages[key], result)
+            rows[key] = {name: value for name, value in result.items()
+                         if not isinstance(value, (dict, list))}
+        if not summary:
+            self.refresh()
+        return DataFrame.from_dict(rows, orient="index")
 
-    def graph_edit_distance(self, exclude=None, gen=False, bound=1000, time=10):
+    def graph_edit_distance(self, exclude=None, gen=False, bound=1000, time=10,
+                            workers=None, labels=False):
         """
+        Returns a list [dist_frame, summary_frame] of pandas DataFrames for
+        the pairwise graph edit distances between the SynGraphs of the Poems
+        in the Book.
+
+        Only the upper triangle is computed, over a pool of worker processes.
+        Pairs whose cheap lower bound exceeds bound are skipped. The
+        DataFrame dist_frame.attrs["flags"] has the same shape as dist_frame
+        and marks every cell as "exact", "bound" (the distance exceeds bound
+        and the cell holds a lower bound) or "timeout" (the cell holds the
+        best distance found in time seconds).
 
+        Parameter exclude: an (attribute, value) pair. Poems whose attribute
+        equals value are left out.
+        Precondition: exclude is a tuple or None.
+        Parameter gen: Whether to generate the SynGraphs of the Poems first.
+        Precondition: gen is a bool.
+        Parameter bound: the upper bound on graph edit distance.
+        Precondition: bound is a number or None.
+        Parameter time: the timeout in seconds for each pair.
+        Precondition: time is a number or None.
+        Parameter workers: the number of worker processes (None for one per
+        CPU, 1 to run in this process).
+        Precondition: workers is a positive int or None.
+        Parameter labels: Whether nodes are matched by word.
+        Precondition: labels is a bool.
         """
-        poems = {}
         if gen:
-            for key, poem in self.pages.items():
-                poem.gen_sg()
-        if exclude:
-            for key, value in self.pages.items():
-                if getattr(value, exclude[0]) != exclude[1]:
-                    poems.update({key: value})
-        else:
-            poems = self.pages
-        dist = {"Labels": []}
+            self.gen_graphs(wg=False, workers=workers)
+        poems = self._subset(exclude)
+        keys = list(poems)
+        graphs = [poems[key].sg.get_graph() for key in keys]
+        steps, marks = ged.pairwise(graphs, bound=bound, time=time,
+                                    workers=workers, labels=labels)
+        dist = {"Labels": keys}
+        flags = {"Labels": keys}
         summary = {"Nodes": [], "Edges": []}
-        for key, poem in poems.items():
-            dist["Labels"].append(key)
-            steps = {key: []}
-            summary["Nodes"].append(poem.get_num_nodes())
-            summary["Edges"].append(poem.get_num_edges())
-            for i, j in poems.items():
-                if i == key:
-                    steps[key].append(0)
-                else:
-                    ged = algs.graph_edit_distance(poem.sg.get_graph(),
-                                                   j.sg.get_graph(),
-                                                   upper_bound=bound,
-                                                   timeout=time)
-                    steps[key].append(ged)
-            dist.update(steps)
+        for i, key in enumerate(keys):
+            dist.update({key: steps[i]})
+            flags.update({key: marks[i]})
+            summary["Nodes"].append(poems[key].get_num_nodes())
+            summary["Edges"].append(poems[key].get_num_edges())
         summary.update({"Labels": dist["Labels"]})
         dist_frame = DataFrame(data=dist)
         dist_frame.set_index("Labels")
+        dist_frame.attrs["flags"] = DataFrame(data=flags)
         summary_frame = DataFrame(data=summary)
         summary_frame.set_index("Labels")
         return [dist_frame, summary_frame]
 
+    def graph_kernel(self, exclude=None, gen=False, method="wl", iterations=3,
+                     labels=False, syn=True, dist=False, workers=None):
+        """
+        Returns a list [sim_frame, summary_frame] of pandas DataFrames, laid
+        out like those of graph_edit_distance(), for the pairwise structural
+        similarities between the graphs of the Poems in the Book.
 
+        Every graph is embedded once (see kernels), and similarities are the
+        cosines between embeddings, from 1 for graphs with the same features
+        to 0 for graphs with none in common. Unlike graph edit distance, this
+        takes seconds for thousands of Poems and does not depend on timeouts.
 
+        Parameter exclude: an (attribute, value) pair. Poems whose attribute
+        equals value are left out.
+        Precondition: exclude is a tuple or None.
+        Parameter gen: Whether to generate the graphs of the Poems first.
+        Precondition: gen is a bool.
+        Parameter method: "wl" for Weisfeiler-Lehman subtree features, or
+        "hist" for degree and synset histograms.
+        Precondition: method is a string.
+        Parameter iterations: the number of Weisfeiler-Lehman iterations.
+        Precondition: iterations is a positive int.
+        Parameter labels: Whether Weisfeiler-Lehman starts from words (True)
+        or node degrees (False).
+        Precondition: labels is a bool.
+        Parameter syn: True to compare SynGraphs, False for WordGraphs.
+        Precondition: syn is a bool.
+        Parameter dist: Whether to return distances (1 - similarity) instead.
+        Precondition: dist is a bool.
+        Parameter workers: the number of worker processes used by gen.
+        Precondition: workers is a positive int or None.
+        """
+        if gen:
+            self.gen_graphs(wg=not syn, sg=syn, workers=workers)
+        poems = self._subset(exclude)
+        keys = list(poems)
+        if syn:
+            graphs = [poems[key].get_sg().get_graph() for key in keys]
+        else:
+            graphs = [poems[key].get_wg().get_graph() for key in keys]
+        matrix = kernels.similarity(kernels.embed(graphs, method=method,
+                                                  iterations=iterations,
+                                                  labels=labels))
+        if dist:
+            matrix = 1.0 - matrix
+        sim = {"Labels": keys}
+        summary = {"Nodes": [], "Edges": []}
+        for i, key in enumerate(keys):
+            sim.update({key: matrix[i]})
+            summary["Nodes"].append(graphs[i].number_of_nodes())
+            summary["Edges"].append(graphs[i].number_of_edges())
+        summary.update({"Labels": keys})
+        sim_frame = DataFrame(data=sim)
+        sim_frame.attrs["method"] = method
+        return [sim_frame, DataFrame(data=summary)]
 
+    def _subset(self, exclude):
+        """
+        Returns the pages whose Poems are not excluded by an (attribute,
+        value) pair, or all pages if exclude is None.
+        """
+        if not exclude:
+            return self.pages
+        return {key: self.pages[key]
+                for key in self.exclude(exclude[0], exclude[1])}
 
-
-
-    def get_distance(self, alg="jaccard"):
+    def get_distance(self, alg="jaccard", as_set=False, dtype="float64"):
         """
         Returns a pandas DataFrame of of pairwise
         textdistance comparisons for all elements of pages.
+
+        Distances are normalized to [0, 1]. Token-based algorithms (jaccard,
+        sorensen, overlap, cosine, bag) are computed with sparse matrix
+        products; other textdistance algorithms are called once per pair.
+
+        Parameter alg: the name of a textdistance algorithm.
+        Precondition: alg is a string.
+        Parameter as_set: Whether repeated words are counted once.
+        Precondition: as_set is a bool.
+        Parameter dtype: the dtype of the distances.
+        Precondition: dtype is a NumPy float dtype.
+        """
+        keys = list(self.pages)
+        words = [self.pages[key].get_words() for key in keys]
+        dist = distance.matrix(words, alg=alg, as_set=as_set, dtype=dtype)
+        return DataFrame(dist, index=keys, columns=keys, copy=False)
+
+    def iter_distance(self, alg="jaccard", chunk=1000, as_set=False,
+                      dtype="float32"):
         """
-        pass
+        Yields pandas DataFrames of pairwise textdistance comparisons, chunk
+        rows at a time, so that the full matrix is never held in memory.
 
-    def df(self, attribute):
+        Parameter chunk: the number of rows in each DataFrame.
+        Precondition: chunk is a positive int.
+
+        Other parameters are the same as for get_distance().
+        """
+        keys = list(self.pages)
+        words = [self.pages[key].get_words() for key in keys]
+        for start, stop, block in distance.blocks(words, alg=alg, chunk=chunk,
+                                                  as_set=as_set, dtype=dtype):
+            yield DataFrame(block, index=keys[start:stop], columns=keys,
+                            copy=False)
+
+    def df(self, *attributes):
         """
+        Returns a pandas DataFrame of the Book's columns, indexed by key. The
+        DataFrame shares memory with the columns, so copy it before changing
+        it.
+
+        Parameter attributes: the columns to include (all if none are given).
+        Precondition: attributes are names in columns.COLUMNS.
         """
-        pass
+        return self._columns.frame(list(attributes) or None)
@@ -0,0 +1,150 @@
+"""
+A columnar view of the attributes of the Poems in a Book.
+
+Every column is a NumPy array with one row per page, grown by doubling, so a
+pandas DataFrame of the columns can be built without copying them, and filters
+are vectorized comparisons instead of loops over Book.pages. Strings are kept
+in object arrays and missing numbers (e.g. the node count of a Poem without a
+graph) are NaN. Word and line counts are only read from the Poems when those
+columns are first used, so a Book of LeanPoems does not tokenize them all.
+"""
+import numpy as np
+from pandas import DataFrame
+
+
+def _get(poem, name):
+    """
+    Returns poem.name(), or None if poem has no such method or it raises
+    (e.g. a graph does not exist). Pages only need a text attribute.
+    """
+    func = getattr(poem, name, None)
+    if func is None:
+        return None
+    try:
+        return func()
+    except Exception:
+        return None
+
+
+def _attr(poem, name):
+    """
+    Returns poem.name, or None if poem has no such (non-method) attribute.
+    """
+    value = getattr(poem, name, None)
+    return None if callable(value) else value
+
+
+# Column name -> (dtype, function from a Poem to its value)
+COLUMNS = {
+    "author": (object, lambda poem: _attr(poem, "author")),
+    "title": (object, lambda poem: _attr(poem, "title")),
+    "label": (object, lambda poem: _attr(poem, "label")),
+    "length": (np.float64, lambda poem: _get(poem, "get_length")),
+    "lines": (np.float64, lambda poem: _get(poem, "num_lines")),
+    "nodes": (np.float64, lambda poem: _get(poem, "get_num_nodes")),
+    "edges": (np.float64, lambda poem: _get(poem, "get_num_edges")),
+    "density": (np.float64, lambda poem: _get(poem, "get_density")),
+    "cycles": (np.float64, lambda poem: _get(poem, "get_num_cycles")),
+}
+
+# Columns that change when a Poem's graphs are generated
+GRAPH_COLUMNS = ("nodes", "edges", "density", "cycles")
+
+# Columns read from Poems only when they are first used, since reading them
+# tokenizes a LeanPoem
+LAZY_COLUMNS = ("length", "lines")
+
+
+class Columns(object):
+    """
+    NumPy columns of Poem attributes, one row per key.
+    """
+
+    def __init__(self, capacity=16):
+        """
+        Parameter capacity: the number of rows allocated up front.
+        Precondition: capacity is a positive int.
+        """
+        self.keys = []
+        self.rows = {}
+        self._arrays = {name: self._empty(dtype, capacity)
+                        for name, (dtype, func) in COLUMNS.items()}
+        # Lazy column -> {row: Poem} of the rows not read yet
+        self._pending = {name: {} for name in LAZY_COLUMNS}
+
+    @staticmethod
+    def _empty(dtype, capacity):
+        if dtype is object:
+            return np.empty(capacity, dtype=object)
+        return np.full(capacity, np.nan, dtype=dtype)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, key, poem, names=None):
+        """
+        Stores the attributes of poem in the row of key, adding a row if key
+        is new. Lazy columns are read when they are first used.
+
+        Parameter names: the columns to store (None for all).
+        Precondition: names is an iterable of column names or None.
+        """
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self._arrays["author"]):
+                self._grow()
+            self.keys.append(key)
+            self.rows[key] = row
+        for name in names or COLUMNS:
+            if name in self._pending:
+                self._pending[name][row] = poem
+            else:
+                self._store(name, row, poem)
+
+    def _store(self, name, row, poem):
+        """
+        Reads column name from poem into row.
+        """
+        value = COLUMNS[name][1](poem)
+        if value is None and COLUMNS[name][0] is not object:
+            value = np.nan
+        self._arrays[name][row] = value
+
+    def _grow(self):
+        """
+        Doubles the capacity of every column.
+        """
+        for name, array in self._arrays.items():
+            bigger = self._empty(COLUMNS[name][0], 2 * len(array))
+            bigger[:len(array)] = array
+            self._arrays[name] = bigger
+
+    def column(self, name):
+        """
+        Returns a view of the filled part of column name.
+        """
+        pending = self._pending.get(name)
+        if pending:
+            for row, poem in pending.items():
+                self._store(name, row, poem)
+            pending.clear()
+        return self._arrays[name][:len(self.keys)]
+
+    def frame(self, names=None):
+        """
+        Returns a pandas DataFrame of the columns, indexed by key, that shares
+        memory with the columns.
+
+        Parameter names: the columns to include (None for all).
+        Precondition: names is a list of column names or None.
+        """
+        names = names or list(COLUMNS)
+        data = {name: self.column(name) for name in names}
+        return DataFrame(data, index=list(self.keys), copy=False)
+
+    def mask(self, name, value):
+        """
+        Returns a boolean array of the rows where column name equals value.
+        """
+        return self.column(name) == value
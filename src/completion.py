@@ -0,0 +1,111 @@
+"""
+An asynchronous client for OpenAI's Completion endpoint.
+
+The client keeps one connection-pooled aiohttp session for all requests, caps
+the number of concurrent requests with a semaphore, and applies a timeout to
+each request, so it can be awaited from the discord event loop without stalling
+it. api_base can point at a local stub server (see stubserver.py) for testing.
+"""
+import asyncio
+import os
+import time
+import aiohttp
+import openai
+from basho.src import metrics
+
+
+class AsyncCompletions(object):
+    """
+    A shared, connection-pooled client for OpenAI completions.
+    """
+
+    def __init__(self, api_base=None, api_key=None, limit=8, timeout=30,
+                 connections=None):
+        """
+        Initializer for the AsyncCompletions class.
+
+        Parameter api_base: the base url of the api. If None, openai.api_base
+        is used.
+        Precondition: api_base is a string or None.
+        Parameter api_key: the api key. If None, openai.api_key is used.
+        Precondition: api_key is a string or None.
+        Parameter limit: the maximum number of concurrent requests.
+        Precondition: limit is a positive int.
+        Parameter timeout: the timeout in seconds for each request.
+        Precondition: timeout is a number.
+        Parameter connections: the size of the connection pool. If None, it
+        is the same as limit.
+        Precondition: connections is a positive int or None.
+        """
+        if api_base is None:
+            api_base = getattr(openai, "api_base", "https://api.openai.com/v1")
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.limit = limit
+        self.timeout = timeout
+        self.connections = connections or limit
+        self._session = None
+        self._semaphore = None
+
+    async def create(self, engine, prompt, timeout=None, **params):
+        """
+        Returns the json response of a completion request as a dictionary.
+
+        Parameter engine: the OpenAI engine to use.
+        Precondition: engine is a string.
+        Parameter prompt: the prompt, or a list of prompts.
+        Precondition: prompt is a string or a list of strings.
+        Parameter timeout: the timeout in seconds for this request. If None,
+        the client's timeout is used.
+        Precondition: timeout is a number or None.
+
+        Additional keyword arguments (temperature, max_tokens, ...) are sent
+        with the request.
+        """
+        session = self._get_session()
+        body = dict(params, prompt=prompt)
+        url = "{}/engines/{}/completions".format(self.api_base, engine)
+        if timeout is None:
+            timeout = self.timeout
+        # Requests waiting for the semaphore are queued
+        queued = time.perf_counter()
+        metrics.add("basho_completion_queued", 1)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            metrics.add("basho_completion_queued", -1)
+        try:
+            metrics.observe("basho_completion_wait_seconds",
+                            time.perf_counter() - queued)
+            with metrics.span("completion"):
+                async with session.post(
+                        url, json=body,
+                        timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    response.raise_for_status()
+                    return await response.json()
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        """
+        Closes the session and its connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        """
+        Returns the session, creating it in the running event loop if needed.
+        """
+        if self._session is None or self._session.closed:
+            key = self.api_key or openai.api_key or os.getenv("OPENAI_API_KEY")
+            headers = {}
+            if key:
+                headers["Authorization"] = "Bearer " + key
+            connector = aiohttp.TCPConnector(limit=self.connections)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=headers)
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._session
@@ -0,0 +1,300 @@
+"""
+A cache for OpenAI completions made by a Poet.
+
+Completions are keyed on the engine, the sampling parameters, and either only
+the seed (by="seed", the default, which reuses a poem for a popular seed
+whatever examples were sampled from the same header and corpus) or the full
+prompt (by="prompt"). Prompts
+include randomly sampled examples, so prompt keys only hit when the examples
+are fixed, e.g. with a seed-aware Poet (see Poet.retrieve()). Entries
+expire after a TTL and the least recently used are evicted past a size bound.
+Concurrent requests for the same key are coalesced into one upstream call, both
+from threads (fetch) and from coroutines (afetch).
+"""
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class MemoryBackend(object):
+    """
+    An in-memory LRU store of cached completions.
+    """
+
+    def __init__(self, size=1024):
+        """
+        Parameter size: the maximum number of entries.
+        Precondition: size is a positive int.
+        """
+        self.size = size
+        self._entries = OrderedDict()
+        # Poets write from thread pools, and reads reorder entries too
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns a tuple (value, expires) for key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires):
+        """
+        Stores value for key until the time expires (None for never).
+        """
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend(object):
+    """
+    A sqlite store of cached completions that survives restarts.
+    """
+
+    def __init__(self, path, size=100000):
+        """
+        Parameter path: the sqlite file.
+        Precondition: path is a string.
+        Parameter size: the maximum number of entries.
+        Precondition: size is a positive int.
+        """
+        self.size = size
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT "
+                         "PRIMARY KEY, value TEXT, expires REAL, used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_used ON "
+                         "completions (used)")
+        self._db.commit()
+
+    def get(self, key):
+        """
+        Returns a tuple (value, expires) for key, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM completions "
+                                   "WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE completions SET used = ? WHERE "
+                                 "key = ?", (time.time(), key))
+                self._db.commit()
+        return row
+
+    def set(self, key, value, expires):
+        """
+        Stores value for key until the time expires (None for never).
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO completions VALUES "
+                             "(?, ?, ?, ?)", (key, value, expires, time.time()))
+            self._writes += 1
+            # Evicting scans the table, so only do it every so often
+            if self._writes % 64 == 0:
+                self._db.execute("DELETE FROM completions WHERE key IN "
+                                 "(SELECT key FROM completions ORDER BY used "
+                                 "DESC LIMIT -1 OFFSET ?)", (self.size,))
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM "
+                                    "completions").fetchone()[0]
+
+
+class _Flight(object):
+    """
+    An upstream call that other threads are waiting on.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CompletionCache(object):
+    """
+    A TTL and size bounded cache of completion texts with request coalescing.
+    """
+
+    def __init__(self, backend=None, ttl=3600, by="seed"):
+        """
+        Initializer for the CompletionCache class.
+
+        Parameter backend: where entries are stored. If None, a MemoryBackend
+        is used.
+        Precondition: backend is a MemoryBackend, DiskBackend or None.
+        Parameter ttl: the number of seconds entries are kept (None for
+        forever).
+        Precondition: ttl is a number or None.
+        Parameter by: "seed" to key on the seed only, or "prompt" to key on
+        the whole prompt (which only hits when examples are not sampled).
+        Precondition: by is "prompt" or "seed".
+        """
+        if by not in ("prompt", "seed"):
+            raise ValueError("by must be 'prompt' or 'seed'")
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+        self.ttl = ttl
+        self.by = by
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._aflights = {}
+
+    def key(self, engine, params, seed, prompt, scope=None):
+        """
+        Returns the cache key of a completion request as a hex digest.
+
+        Parameter engine: the OpenAI engine.
+        Precondition: engine is a string.
+        Parameter params: the sampling parameters.
+        Precondition: params is a json serializable dictionary.
+        Parameter seed: the seed of the poem.
+        Precondition: seed is a string.
+        Parameter prompt: the full prompt.
+        Precondition: prompt is a string.
+        Parameter scope: what shaped the prompt besides the seed, e.g. a
+        digest of a Poet's header and corpus. Seed keys include it, so Poets
+        that share a backend do not get each other's poems.
+        Precondition: scope is a string or None.
+        """
+        if self.by == "seed":
+            request = [engine, params, seed, scope]
+        else:
+            request = [engine, params,
+                       hashlib.sha256(prompt.encode()).hexdigest()]
+        data = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            self.backend.delete(key)
+            return None
+        return value
+
+    def put(self, key, value):
+        """
+        Stores value for key for ttl seconds.
+        """
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        self.backend.set(key, value, expires)
+
+    def stats(self):
+        """
+        Returns a dictionary of hit, miss and coalesced request counts.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "size": len(self.backend)}
+
+    def fetch(self, key, func):
+        """
+        Returns the cached value for key, calling func() to compute it on a
+        miss. Threads asking for a key that is already being computed wait
+        for that call instead of making their own.
+
+        Parameter key: the cache key.
+        Precondition: key is a string.
+        Parameter func: a function of no arguments returning the value.
+        Precondition: func is callable.
+        """
+        with self._lock:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = func()
+            self.put(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    async def afetch(self, key, func):
+        """
+        The same as fetch(), for coroutines: func() returns an awaitable, and
+        coroutines asking for a key that is already being computed await the
+        same call.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        future = self._aflights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._aflights[key] = future
+        try:
+            value = await func()
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Only waiters should see the error, not the event loop
+            future.exception()
+            raise
+        finally:
+            del self._aflights[key]
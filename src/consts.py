@@ -17,3 +17,9 @@ CORPUS = "basho_corpus.json"
 
 # Number of poems to be sampled. An int. (larger numbers are more financially expensive)
 SIZE = 5
+
+# Port of the local Prometheus-style metrics endpoint (None to not serve one)
+METRICS_PORT = os.getenv("BASHOBOT_METRICS_PORT")
+
+# Seconds between dumps of the metrics to the log (None for no dumps)
+METRICS_LOG = os.getenv("BASHOBOT_METRICS_LOG")
@@ -0,0 +1,229 @@
+"""
+An offset-indexed, memory-mapped corpus store for Poets.
+
+A corpus is a JSONL file with one [label, poem] array per line, next to an
+index file (the same path + ".idx.npy") holding the byte offset, byte length
+and token count of every line, and a sorted table of key hashes. Both files are
+memory-mapped, so any example can be read by index or by label without loading
+the rest of the corpus:
+
+    convert("basho_corpus.json", "basho_corpus.jsonl")
+    poet = Poet(HEADER, "basho_corpus.jsonl")
+"""
+from collections.abc import Mapping, Sequence
+import hashlib
+import json
+import mmap
+import re
+import numpy as np
+
+# The prompt fragment of one example from the corpus
+FRAGMENT = "Seed: {}\nPoem: {}\n###\n"
+
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("length", "<i4"),
+                        ("tokens", "<i4"), ("hash", "<i8"), ("order", "<i8")])
+
+# tiktoken's encoding, loaded by the first count_tokens() call (False until
+# then, None if tiktoken is unavailable)
+_encoding = False
+
+
+def _get_encoding():
+    """
+    Returns tiktoken's GPT-3 encoding, or None if it cannot be loaded.
+    """
+    global _encoding
+    if _encoding is False:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("r50k_base")
+        except Exception:
+            # tiktoken is optional, and fetches its encodings on first use
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Returns the number of tokens in text, using tiktoken's GPT-3 encoding if
+    it is installed and an estimate of one token per word or punctuation mark
+    otherwise.
+
+    Parameter text: the text to count.
+    Precondition: text is a string.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _hash(key):
+    """
+    Returns a stable signed 64 bit hash of key.
+    """
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def write(pairs, path):
+    """
+    Writes (label, poem) pairs to a JSONL corpus and its index.
+
+    Parameter pairs: the examples to write.
+    Precondition: pairs is an iterable of (string, string) pairs (a generator
+    is fine).
+    Parameter path: the path of the JSONL file.
+    Precondition: path is a string.
+    """
+    rows = []
+    offset = 0
+    with open(path, "wb") as file:
+        for key, text in pairs:
+            line = json.dumps([key, text]).encode() + b"\n"
+            file.write(line)
+            tokens = count_tokens(FRAGMENT.format(key, text))
+            rows.append((offset, len(line) - 1, tokens, _hash(key), 0))
+            offset += len(line)
+    index = np.array(rows, dtype=INDEX_DTYPE)
+    order = np.argsort(index["hash"], kind="stable")
+    index["order"] = order
+    index["hash"] = index["hash"][order]
+    np.save(path + ".idx.npy", index)
+
+
+def convert(source, path):
+    """
+    Converts a json corpus of {label: poem} pairs (like basho_corpus.json) to
+    a JSONL corpus and its index.
+
+    Parameter source: the json file to convert.
+    Precondition: source is a valid json file.
+    Parameter path: the path of the JSONL file.
+    Precondition: path is a string.
+    """
+    with open(source) as json_file:
+        corpus = json.load(json_file)
+    write(corpus.items(), path)
+
+
+class _Column(Sequence):
+    """
+    A read-only sequence computed from a function of an index.
+    """
+
+    def __init__(self, func, length):
+        self._func = func
+        self._length = length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._func(j) for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return self._func(i)
+
+    def __len__(self):
+        return self._length
+
+
+class JsonlCorpus(Mapping):
+    """
+    A read-only {label: poem} mapping backed by a memory-mapped JSONL corpus.
+    """
+
+    def __init__(self, path):
+        """
+        Parameter path: the JSONL file, written by write() or convert().
+        Precondition: path is a string, and path + ".idx.npy" exists.
+        """
+        self.path = path
+        self.index = np.load(path + ".idx.npy", mmap_mode="r")
+        with open(path, "rb") as file:
+            if len(self.index):
+                self._map = mmap.mmap(file.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            else:
+                self._map = b""
+
+    def entry(self, i):
+        """
+        Returns the (label, poem) pair at index i.
+        """
+        offset = int(self.index["offset"][i])
+        length = int(self.index["length"][i])
+        key, text = json.loads(self._map[offset:offset + length])
+        return key, text
+
+    def key_at(self, i):
+        return self.entry(i)[0]
+
+    def text_at(self, i):
+        return self.entry(i)[1]
+
+    def position(self, key):
+        """
+        Returns the index of key, or raises KeyError.
+        """
+        h = _hash(key)
+        hashes = self.index["hash"]
+        j = int(np.searchsorted(hashes, h))
+        while j < len(hashes) and hashes[j] == h:
+            i = int(self.index["order"][j])
+            if self.key_at(i) == key:
+                return i
+            j += 1
+        raise KeyError(key)
+
+    def keys_list(self):
+        """
+        Returns a sequence of the labels, read on access.
+        """
+        return _Column(self.key_at, len(self))
+
+    def fragments(self):
+        """
+        Returns a sequence of the prompt fragments, read on access.
+        """
+        return _Column(lambda i: FRAGMENT.format(*self.entry(i)), len(self))
+
+    def tokens(self):
+        """
+        Returns the memory-mapped array of token counts of the fragments.
+        """
+        return self.index["tokens"]
+
+    def digest(self):
+        """
+        Returns a hex digest of the index, which changes with the labels and
+        texts of the corpus.
+        """
+        # Every row holds the offset, length and label hash of an example
+        data = np.ascontiguousarray(self.index).tobytes()
+        return hashlib.sha256(data).hexdigest()
+
+    def total_tokens(self):
+        """
+        Returns the total token count of the fragments, as an int.
+        """
+        # The counts are int32, and their sum can overflow
+        return int(self.index["tokens"].sum(dtype=np.int64))
+
+    def __getitem__(self, key):
+        return self.text_at(self.position(key))
+
+    def __contains__(self, key):
+        try:
+            self.position(key)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.key_at(i)
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,195 @@
+"""
+Bounded enumeration of the cycles of a graph.
+
+The number of simple cycles of a WordGraph grows exponentially with its size,
+so find() can count cycles without storing them, stop after a number of
+cycles or seconds, and skip cycles longer than a bound. Directed graphs are
+split into strongly connected components first: every cycle lies inside one
+component, so acyclic parts of the graph are never searched. Components are
+searched here rather than by networkx, so a timeout is also checked while a
+large component is being searched, not only between cycles.
+"""
+from collections import Counter, defaultdict
+import time as clock
+import networkx as nx
+import networkx.algorithms as algs
+
+COMPLETE = "complete"
+LIMIT = "limit"
+TIMEOUT = "timeout"
+
+
+def components(g):
+    """
+    Yields the subgraphs of g that can contain cycles: the strongly connected
+    components of a directed graph with more than one node or a self-loop, or
+    the whole of an undirected graph.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    """
+    if not g.is_directed():
+        yield g
+        return
+    for nodes in algs.strongly_connected_components(g):
+        if len(nodes) > 1:
+            yield g.subgraph(nodes)
+        else:
+            node = next(iter(nodes))
+            if g.has_edge(node, node):
+                yield g.subgraph(nodes)
+
+
+def _search(g, length=None, deadline=None, every=100):
+    """
+    Yields the simple cycles of a directed graph, as nx.simple_cycles()
+    does, with Johnson's algorithm (or a depth-bounded search if length is
+    not None). Once deadline (a time.monotonic() value) has passed, yields
+    None and stops. The deadline is checked every every steps.
+    """
+    adj = {v: set(g.successors(v)) for v in g}
+    for v in g:
+        if v in adj[v]:
+            adj[v].discard(v)
+            yield [v]
+    if length is not None and length < 2:
+        return
+    steps = 0
+    sccs = [set(c) for c in algs.strongly_connected_components(g)
+            if len(c) > 1]
+    while sccs:
+        members = sccs.pop()
+        start = next(iter(members))
+        path = [start]
+        if length is None:
+            # Johnson's algorithm: a node stays blocked until a cycle is
+            # found through it, so dead ends are not searched twice
+            blocked = {start}
+            closed = set()
+            waiting = defaultdict(set)
+            stack = [(start, [n for n in adj[start] if n in members])]
+            while stack:
+                steps += 1
+                if (deadline is not None and steps % every == 0
+                        and clock.monotonic() > deadline):
+                    yield None
+                    return
+                node, nbrs = stack[-1]
+                if nbrs:
+                    nxt = nbrs.pop()
+                    if nxt == start:
+                        yield path[:]
+                        closed.update(path)
+                    elif nxt not in blocked:
+                        path.append(nxt)
+                        stack.append((nxt, [n for n in adj[nxt]
+                                            if n in members]))
+                        closed.discard(nxt)
+                        blocked.add(nxt)
+                        continue
+                if not nbrs:
+                    if node in closed:
+                        _unblock(node, blocked, waiting)
+                    else:
+                        for n in adj[node]:
+                            if n in members:
+                                waiting[n].add(node)
+                    stack.pop()
+                    path.pop()
+        else:
+            on_path = {start}
+            stack = [iter(adj[start])]
+            while stack:
+                steps += 1
+                if (deadline is not None and steps % every == 0
+                        and clock.monotonic() > deadline):
+                    yield None
+                    return
+                nxt = next(stack[-1], None)
+                if nxt is None:
+                    stack.pop()
+                    on_path.discard(path.pop())
+                elif nxt == start:
+                    yield path[:]
+                elif (nxt in members and nxt not in on_path
+                      and len(path) < length):
+                    path.append(nxt)
+                    on_path.add(nxt)
+                    stack.append(iter(adj[nxt]))
+        # Every cycle through start was found, so search the rest without it
+        members.discard(start)
+        sccs.extend(set(c) for c in
+                    algs.strongly_connected_components(g.subgraph(members))
+                    if len(c) > 1)
+
+
+def _unblock(node, blocked, waiting):
+    """
+    Unblocks node, and the nodes waiting on it, for _search().
+    """
+    stack = {node}
+    while stack:
+        node = stack.pop()
+        if node in blocked:
+            blocked.remove(node)
+            stack.update(waiting[node])
+            waiting[node].clear()
+
+
+def find(g, length=None, limit=None, timeout=None, store=True):
+    """
+    Returns a dictionary describing the simple cycles of g:
+        "count": the number of cycles found,
+        "histogram": a Counter of {cycle length: number of cycles},
+        "cycles": the cycles as lists of nodes (empty if store is False),
+        "status": "complete" if every cycle was found, otherwise "limit" or
+        "timeout" for the bound that stopped the search.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    Parameter length: the longest cycle to find (None for no bound). The
+    bound also prunes the search, so it is much faster than filtering.
+    Precondition: length is a positive int or None.
+    Parameter limit: the most cycles to find (None for no limit).
+    Precondition: limit is a non-negative int or None.
+    Parameter timeout: the number of seconds after which the search stops
+    (None for no timeout). It is checked between cycles and, for directed
+    graphs, while a component is searched.
+    Precondition: timeout is a number or None.
+    Parameter store: Whether to keep the cycles or only count them.
+    Precondition: store is a bool.
+    """
+    start = clock.monotonic()
+    histogram = Counter()
+    found = []
+    count = 0
+    status = COMPLETE
+    if limit is not None and limit <= 0:
+        status = LIMIT
+    deadline = None if timeout is None else start + timeout
+    for sub in components(g) if status == COMPLETE else ():
+        if deadline is not None and clock.monotonic() > deadline:
+            status = TIMEOUT
+            break
+        if sub.is_directed():
+            search = _search(sub, length, deadline)
+        else:
+            search = nx.simple_cycles(sub, length_bound=length)
+        for cycle in search:
+            if cycle is None:
+                status = TIMEOUT
+                break
+            count += 1
+            histogram[len(cycle)] += 1
+            if store:
+                found.append(cycle)
+            if limit is not None and count >= limit:
+                status = LIMIT
+                break
+            if deadline is not None and clock.monotonic() > deadline:
+                status = TIMEOUT
+                break
+        if status != COMPLETE:
+            break
+    return {"count": count, "histogram": histogram, "cycles": found,
+            "status": status}
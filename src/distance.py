@@ -0,0 +1,152 @@
+"""
+Pairwise textdistance comparisons for the Poems in a Book.
+
+Token-based metrics (jaccard, sorensen, overlap, cosine, bag) only need the
+size of the intersection of two bags of words. Each Poem is tokenized once into
+integer vocabulary IDs, where the n-th occurrence of a word gets its own ID, so
+the multiset intersection of two Poems is the dot product of two binary rows of
+a sparse matrix. Other textdistance algorithms fall back to one call per pair.
+
+Rows of the distance matrix are produced in blocks, so a large Book never needs
+the whole matrix in memory.
+"""
+from collections import Counter
+import numpy as np
+import textdistance as td
+from scipy.sparse import csr_matrix
+
+# Token-based algorithms that are computed from intersection sizes
+VECTORIZED = ("jaccard", "sorensen", "sorensen_dice", "overlap", "cosine",
+              "bag")
+
+# Algorithms where d(a, b) == d(b, a), so only the upper triangle is computed
+SYMMETRIC = ("hamming", "levenshtein", "damerau_levenshtein", "jaro",
+             "jaro_winkler", "strcmp95", "mlipns", "lcsseq", "lcsstr",
+             "ratcliff_obershelp", "identity", "length")
+
+
+def encode(sequences, as_set=False):
+    """
+    Returns a tuple (matrix, sizes), where matrix is a sparse binary
+    len(sequences) x vocabulary CSR matrix and sizes holds the number of
+    tokens in each sequence.
+
+    Parameter sequences: the tokenized texts.
+    Precondition: sequences is a list of lists of strings.
+    Parameter as_set: Whether repeated tokens are counted once.
+    Precondition: as_set is a bool.
+    """
+    vocab = {}
+    indptr = [0]
+    indices = []
+    for words in sequences:
+        if as_set:
+            tokens = set(words)
+        else:
+            tokens = [(word, k) for word, count in Counter(words).items()
+                      for k in range(count)]
+        for token in tokens:
+            indices.append(vocab.setdefault(token, len(vocab)))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float64)
+    matrix = csr_matrix((data, indices, indptr),
+                        shape=(len(sequences), len(vocab)))
+    sizes = np.diff(np.asarray(indptr, dtype=np.float64))
+    return matrix, sizes
+
+
+def _from_intersection(alg, inter, a, b):
+    """
+    Returns normalized distances given intersection sizes and the sizes of
+    both sides, following textdistance's conventions for empty sequences.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if alg == "jaccard":
+            dist = 1 - inter / (a + b - inter)
+        elif alg in ("sorensen", "sorensen_dice"):
+            dist = 1 - 2 * inter / (a + b)
+        elif alg == "overlap":
+            dist = 1 - inter / np.minimum(a, b)
+        elif alg == "cosine":
+            dist = 1 - inter / np.sqrt(a * b)
+        else:
+            longest = np.maximum(a, b)
+            dist = (longest - inter) / longest
+    empty = (a == 0) | (b == 0)
+    dist = np.where(empty, 1.0, dist)
+    return np.where((a == 0) & (b == 0), 0.0, dist)
+
+
+def blocks(sequences, alg="jaccard", chunk=1000, as_set=False,
+           dtype=np.float64):
+    """
+    Yields tuples (start, stop, block), where block is a NumPy array of the
+    normalized distances between sequences[start:stop] and all sequences.
+
+    Parameter sequences: the tokenized texts.
+    Precondition: sequences is a list of lists of strings.
+    Parameter alg: the name of a textdistance algorithm.
+    Precondition: alg is a string.
+    Parameter chunk: the number of rows in each block.
+    Precondition: chunk is a positive int.
+    Parameter as_set: Whether repeated tokens are counted once.
+    Precondition: as_set is a bool.
+    Parameter dtype: the NumPy dtype of each block.
+    """
+    n = len(sequences)
+    if alg in VECTORIZED:
+        # textdistance's bag distance always counts repeated tokens
+        rows, sizes = encode(sequences, as_set=as_set and alg != "bag")
+        other = rows.T.tocsc()
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            inter = (rows[start:stop] @ other).toarray()
+            a = sizes[start:stop, None]
+            dist = _from_intersection(alg, inter, a, sizes[None, :])
+            yield start, stop, dist.astype(dtype, copy=False)
+        return
+    measure = _measure(alg, as_set)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        block = np.empty((stop - start, n), dtype=dtype)
+        for i in range(start, stop):
+            for j in range(n):
+                block[i - start, j] = measure.normalized_distance(
+                    sequences[i], sequences[j])
+        yield start, stop, block
+
+
+def _measure(alg, as_set=False):
+    """
+    Returns the textdistance instance of alg, counting repeated tokens once
+    if as_set is True and the algorithm supports it.
+    """
+    measure = getattr(td, alg)
+    if as_set and hasattr(measure, "as_set"):
+        measure = type(measure)(as_set=True)
+    return measure
+
+
+def matrix(sequences, alg="jaccard", as_set=False, dtype=np.float64):
+    """
+    Returns the full n x n NumPy array of normalized distances.
+
+    Symmetric algorithms that are not vectorized are only called for the
+    upper triangle.
+
+    Parameters are the same as for blocks().
+    """
+    n = len(sequences)
+    if alg in VECTORIZED or alg not in SYMMETRIC:
+        out = np.empty((n, n), dtype=dtype)
+        for start, stop, block in blocks(sequences, alg, as_set=as_set,
+                                         dtype=dtype):
+            out[start:stop] = block
+        return out
+    measure = _measure(alg, as_set)
+    out = np.zeros((n, n), dtype=dtype)
+    for i in range(n):
+        for j in range(i + 1, n):
+            out[i, j] = out[j, i] = measure.normalized_distance(
+                sequences[i], sequences[j])
+    return out
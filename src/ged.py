@@ -0,0 +1,141 @@
+"""
+A pairwise graph edit distance engine for Books.
+
+Graph edit distance is symmetric, so only the upper triangle of the distance
+matrix is computed. Pairs are spread over a process pool, and a cheap lower
+bound is checked for every pair first: pairs whose lower bound is already
+above the upper bound are never passed to networkx.
+"""
+import os
+import time as clock
+from concurrent.futures import ProcessPoolExecutor
+import networkx.algorithms as algs
+
+EXACT = "exact"
+BOUND = "bound"
+TIMEOUT = "timeout"
+
+# Graphs shared with worker processes, set once per worker by _init_worker.
+_graphs = []
+_options = {}
+
+
+def lower_bound(g1, g2, labels=False):
+    """
+    Returns a cheap lower bound on the graph edit distance between g1 and g2.
+
+    Every node or edge that has no counterpart costs at least one edit, so the
+    difference in node and edge counts bounds the distance from below. When
+    labels is True, nodes are matched by name, and every node whose name is
+    missing from the other graph must also be substituted, inserted or deleted.
+
+    Parameter g1, g2: the graphs to compare.
+    Precondition: g1 and g2 are networkx graphs.
+    Parameter labels: Whether nodes are matched by name.
+    Precondition: labels is a bool.
+    """
+    n1, n2 = g1.number_of_nodes(), g2.number_of_nodes()
+    if labels:
+        shared = sum(1 for node in g1 if node in g2)
+        nodes = max(n1, n2) - shared
+    else:
+        nodes = abs(n1 - n2)
+    return nodes + abs(g1.number_of_edges() - g2.number_of_edges())
+
+
+def _match_label(a, b):
+    """
+    Node match function for labelled graph edit distance.
+    """
+    return a.get("_label") == b.get("_label")
+
+
+def _init_worker(graphs, options):
+    """
+    Stores the graphs and options in a worker process.
+    """
+    global _graphs, _options
+    if options["labels"]:
+        labelled = []
+        for g in graphs:
+            g = g.copy()
+            for node in g:
+                g.nodes[node]["_label"] = node
+            labelled.append(g)
+        graphs = labelled
+    _graphs = graphs
+    _options = options
+
+
+def _pair(pair):
+    """
+    Computes the distance for one (i, j) pair of _graphs.
+
+    Returns a tuple (i, j, distance, flag), where flag is EXACT, BOUND or
+    TIMEOUT.
+    """
+    i, j = pair
+    g1, g2 = _graphs[i], _graphs[j]
+    bound = _options["bound"]
+    lb = lower_bound(g1, g2, labels=_options["labels"])
+    if bound is not None and lb > bound:
+        return (i, j, lb, BOUND)
+    match = _match_label if _options["labels"] else None
+    start = clock.perf_counter()
+    ged = algs.graph_edit_distance(g1, g2, node_match=match,
+                                   upper_bound=bound,
+                                   timeout=_options["time"])
+    elapsed = clock.perf_counter() - start
+    timed_out = _options["time"] is not None and elapsed >= _options["time"]
+    if ged is None:
+        # No path was found, either within the bound or within the time
+        if bound is None or timed_out:
+            return (i, j, lb, TIMEOUT)
+        return (i, j, max(lb, bound), BOUND)
+    if timed_out:
+        return (i, j, ged, TIMEOUT)
+    return (i, j, ged, EXACT)
+
+
+def pairwise(graphs, bound=1000, time=10, workers=None, labels=False,
+             chunksize=16):
+    """
+    Returns a tuple (distances, flags) of n x n nested lists for the upper
+    triangle of graphs, mirrored into the lower triangle.
+
+    A flag is EXACT when the distance was computed exactly, BOUND when the
+    distance is known to exceed bound (the value is then a lower bound), and
+    TIMEOUT when networkx ran out of time (the value is then the best distance
+    found, an upper bound, or a lower bound if no distance was found).
+
+    Parameter graphs: the graphs to compare.
+    Precondition: graphs is a list of networkx graphs.
+    Parameter bound: the upper bound passed to networkx.
+    Precondition: bound is a number or None.
+    Parameter time: the timeout in seconds for each pair.
+    Precondition: time is a number or None.
+    Parameter workers: the number of worker processes. If None, uses the
+    number of CPUs. If 1, all pairs are computed in this process.
+    Precondition: workers is a positive int or None.
+    Parameter labels: Whether nodes are matched by name.
+    Precondition: labels is a bool.
+    """
+    n = len(graphs)
+    dist = [[0] * n for _ in range(n)]
+    flags = [[EXACT] * n for _ in range(n)]
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    options = {"bound": bound, "time": time, "labels": labels}
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(pairs) < 2:
+        _init_worker(graphs, options)
+        results = [_pair(pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(graphs, options)) as pool:
+            results = list(pool.map(_pair, pairs, chunksize=chunksize))
+    for i, j, ged, flag in results:
+        dist[i][j] = dist[j][i] = ged
+        flags[i][j] = flags[j][i] = flag
+    return dist, flags
@@ -0,0 +1,203 @@
+"""
+A compact binary file format for bGraphs.
+
+A graph file holds a json header followed by raw NumPy arrays, each aligned to
+64 bytes, so every array can be memory-mapped straight from the file:
+
+    nodes       the node names, as one string and an array of offsets
+    indptr      CSR row pointers (int64, one per node plus one)
+    indices     CSR column indices (int32), the target of every edge
+    node/<name> a column of a node attribute
+    edge/<name> a column of an edge attribute, in CSR order
+    syns        (SynGraph) synset names, with CSR pointers into syn_nodes
+
+Numeric attributes are stored as they are. Strings are stored as string
+tables, and any other values (e.g. tuples, or columns with gaps) as json.
+"""
+import json
+import numpy as np
+
+MAGIC = b"BASHOGRF"
+VERSION = 1
+ALIGN = 64
+
+
+def _strings(values):
+    """
+    Returns a tuple (data, offsets) of a string table for a list of strings,
+    where offsets are in characters.
+    """
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return np.frombuffer("".join(values).encode("utf-8"), dtype=np.uint8), \
+        offsets
+
+
+def _from_strings(data, offsets):
+    """
+    Returns the list of strings of a string table.
+    """
+    text = bytes(data).decode("utf-8")
+    bounds = offsets.tolist()
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def _encode(values):
+    """
+    Returns a tuple (encoding, arrays) for a column of values.
+    """
+    if isinstance(values, np.ndarray):
+        return "num", [values]
+    if all(isinstance(value, str) for value in values):
+        return "str", list(_strings(values))
+    if all(isinstance(value, tuple) for value in values):
+        encoding = "tuple"
+    else:
+        encoding = "json"
+    return encoding, list(_strings([json.dumps(value) for value in values]))
+
+
+def _decode(encoding, arrays):
+    """
+    Returns the column of values stored by _encode().
+    """
+    if encoding == "num":
+        return arrays[0]
+    values = _from_strings(*arrays)
+    if encoding == "str":
+        return values
+    values = [json.loads(value) for value in values]
+    if encoding == "tuple":
+        return [tuple(value) for value in values]
+    return values
+
+
+def save(arrays, path, kind="bGraph"):
+    """
+    Writes the arrays of a graph to path.
+
+    Parameter arrays: the arrays of the graph.
+    Precondition: arrays is a dictionary returned by bGraph.to_arrays().
+    Parameter path: the file to write.
+    Precondition: path is a string.
+    Parameter kind: the name of the graph's class.
+    Precondition: kind is a string.
+    """
+    nodes = arrays["nodes"]
+    edges = np.asarray(arrays["edges"], dtype=np.int64).reshape(-1, 2)
+    order = np.argsort(edges[:, 0], kind="stable")
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(edges[:, 0], minlength=len(nodes)))
+    blobs = [("indptr", indptr),
+             ("indices", edges[order, 1].astype(np.int32))]
+    columns = []
+    encoding, parts = _encode(nodes)
+    columns.append(("nodes", encoding, len(parts)))
+    blobs.extend(("nodes", part) for part in parts)
+    for prefix, attrs in (("node/", arrays["node_attrs"]),
+                          ("edge/", arrays["edge_attrs"])):
+        for name, values in attrs.items():
+            if prefix == "edge/":
+                if isinstance(values, np.ndarray):
+                    values = values[order]
+                else:
+                    values = [values[i] for i in order.tolist()]
+            encoding, parts = _encode(values)
+            columns.append((prefix + name, encoding, len(parts)))
+            blobs.extend((prefix + name, part) for part in parts)
+    if "syns" in arrays:
+        names = list(arrays["syns"])
+        members = [np.asarray(arrays["syns"][name], dtype=np.int32)
+                   for name in names]
+        syn_ptr = np.zeros(len(names) + 1, dtype=np.int64)
+        syn_ptr[1:] = np.cumsum([len(m) for m in members])
+        blobs.extend(("syns", part) for part in _strings(names))
+        blobs.append(("syn_ptr", syn_ptr))
+        blobs.append(("syn_nodes", np.concatenate(members) if members
+                      else np.zeros(0, dtype=np.int32)))
+    table = []
+    offset = 0
+    for name, array in blobs:
+        array = np.ascontiguousarray(array)
+        table.append([name, array.dtype.str, list(array.shape), offset])
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"version": VERSION, "kind": kind,
+                         "directed": bool(arrays["directed"]),
+                         "columns": columns, "arrays": table}).encode()
+    start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        file.write(b"\0" * (start - file.tell()))
+        for (name, array), (_, _, _, position) in zip(blobs, table):
+            array = np.ascontiguousarray(array)
+            file.seek(start + position)
+            file.write(array.tobytes())
+        file.truncate(start + offset)
+
+
+def read_header(path):
+    """
+    Returns a tuple (header, start) of the json header of a graph file and
+    the position of its first array.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise Exception(path + " is not a basho graph file.")
+        length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(length))
+    if header["version"] > VERSION:
+        raise Exception("Unsupported graph file version {}."
+                        .format(header["version"]))
+    start = -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+    return header, start
+
+
+def load(path, mmap=True):
+    """
+    Returns a tuple (kind, arrays) of the class name and the arrays, in the
+    form of bGraph.to_arrays(), of a graph file. Numeric arrays are
+    memory-mapped from the file unless mmap is False.
+
+    Parameter path: the file written by save().
+    Precondition: path is a string.
+    Parameter mmap: Whether arrays are memory-mapped (True) or read (False).
+    Precondition: mmap is a bool.
+    """
+    header, start = read_header(path)
+    raw = {}
+    for name, dtype, shape, position in header["arrays"]:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        if count == 0:
+            array = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            array = np.memmap(path, dtype=dtype, mode="r",
+                              offset=start + position, shape=tuple(shape))
+        else:
+            array = np.fromfile(path, dtype=dtype, count=count,
+                                offset=start + position).reshape(shape)
+        raw.setdefault(name, []).append(array)
+    indptr = raw["indptr"][0]
+    indices = raw["indices"][0]
+    sources = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32),
+                        np.diff(indptr))
+    arrays = {"directed": header["directed"],
+              "edges": np.stack([sources, indices], axis=1),
+              "node_attrs": {}, "edge_attrs": {}}
+    for name, encoding, parts in header["columns"]:
+        values = _decode(encoding, raw[name])
+        if name == "nodes":
+            arrays["nodes"] = values
+        elif name.startswith("node/"):
+            arrays["node_attrs"][name[len("node/"):]] = values
+        else:
+            arrays["edge_attrs"][name[len("edge/"):]] = values
+    if "syns" in raw:
+        names = _from_strings(*raw["syns"])
+        pointers = raw["syn_ptr"][0].tolist()
+        members = raw["syn_nodes"][0]
+        arrays["syns"] = {name: members[pointers[i]:pointers[i + 1]]
+                          for i, name in enumerate(names)}
+    return header["kind"], arrays
@@ -0,0 +1,194 @@
+"""
+Batch generation of the WordGraphs and SynGraphs of the Poems in a Book.
+
+Poems are sent to a process pool in chunks, as their words plus the SynCache
+entries of those words, so workers never load WordNet or share a sqlite file.
+Workers build each graph, and optionally its betweenness and cycles, and send
+back either only summary metrics or the graphs in the compact form of
+bGraph.to_arrays() (an int32 edge list over a node list), which is far cheaper
+to pickle than a networkx graph.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from itertools import islice
+import re
+import networkx as nx
+import numpy as np
+from basho.src.nxwordgraph import WordGraph
+from basho.src.syngraph import SynGraph
+from basho.src.syncache import SynCache, get_cache
+from basho.src.cycles import find as find_cycles
+
+WORD = "wg"
+SYN = "sg"
+
+# The SynCache of a worker process, filled chunk by chunk.
+_cache = None
+
+
+def build(words, kinds=(WORD, SYN), betweenness=False, cycles=False,
+          summary=False, cache=None, **kwargs):
+    """
+    Returns a dictionary of the graphs of one Poem and their metrics.
+
+    For every kind of graph built, the dictionary has the keys
+    "<kind>_nodes", "<kind>_edges" and "<kind>_density", "<kind>_betweenness"
+    (the largest normalized betweenness) if betweenness is True, and
+    "<kind>_cycles" for WordGraphs if cycles is True. Unless summary is True,
+    "<kind>" holds the arrays of the graph, with a "betweenness" node
+    attribute if it was computed, and "wg_cycle_list" the cycles as lists of
+    node numbers.
+
+    Parameter words: the words of the Poem.
+    Precondition: words is a list of strings.
+    Parameter kinds: the graphs to build, "wg" and/or "sg".
+    Precondition: kinds is a tuple of strings.
+    Parameter betweenness, cycles: Whether to compute them. cycles may also
+    be a dictionary of bounds for cycles.find() (length, limit, timeout), and
+    then "wg_cycle_status" says whether a bound stopped the search.
+    Precondition: betweenness is a bool, and cycles a bool or dictionary.
+    Parameter summary: Whether to leave the graphs out.
+    Precondition: summary is a bool.
+    Parameter cache: the SynCache for SynGraphs (None for the shared one).
+    Precondition: cache is a SynCache or None.
+
+    Additional keyword arguments (e.g. hyp, index, hub) are passed to
+    SynGraph.
+    """
+    result = {}
+    for kind in kinds:
+        if kind == WORD:
+            graph = WordGraph()
+            graph.merge(Counter(words), Counter(zip(words, words[1:])))
+        else:
+            graph = SynGraph(words, cache=cache, **kwargs)
+        g = graph.get_graph()
+        result[kind + "_nodes"] = g.number_of_nodes()
+        result[kind + "_edges"] = g.number_of_edges()
+        result[kind + "_density"] = nx.density(g)
+        if betweenness:
+            values = graph.betweenness()
+            nx.set_node_attributes(g, values, "betweenness")
+            result[kind + "_betweenness"] = max(values.values(), default=0.0)
+        if cycles and kind == WORD:
+            bounds = cycles if isinstance(cycles, dict) else {}
+            found = find_cycles(g, store=not summary, **bounds)
+            result[kind + "_cycles"] = found["count"]
+            result[kind + "_cycle_status"] = found["status"]
+            found = found["cycles"]
+        if not summary:
+            arrays = graph.to_arrays()
+            result[kind] = arrays
+            if cycles and kind == WORD:
+                ids = {node: i for i, node in enumerate(arrays["nodes"])}
+                result["wg_cycle_list"] = [
+                    np.array([ids[node] for node in cycle], dtype=np.int32)
+                    for cycle in found]
+    return result
+
+
+def attach(poem, result):
+    """
+    Sets the graphs, counts and cycles of poem from the output of build(),
+    as Poem.gen_wg(), gen_sg() and update_cycles() would.
+
+    Parameter poem: the Poem the result was built from.
+    Precondition: poem is a Poem or LeanPoem.
+    Parameter result: the output of build() with summary False.
+    Precondition: result is a dictionary.
+    """
+    if WORD in result:
+        poem.wg = WordGraph.from_arrays(result[WORD])
+        poem._num_nodes = result["wg_nodes"]
+        poem._density = result["wg_density"]
+        if "wg_cycle_list" in result:
+            nodes = result[WORD]["nodes"]
+            poem._cycles = [[nodes[i] for i in cycle.tolist()]
+                            for cycle in result["wg_cycle_list"]]
+            poem._num_cycles = len(poem._cycles)
+    if SYN in result:
+        poem.sg = SynGraph.from_arrays(result[SYN])
+        poem._num_nodes = result["sg_nodes"]
+        poem._num_edges = result["sg_edges"]
+
+
+def _build_chunk(chunk, entries, options):
+    """
+    Builds the graphs of a chunk of (key, words) pairs in a worker process.
+    """
+    global _cache
+    if _cache is None:
+        _cache = SynCache()
+    _cache.update(entries)
+    return [(key, build(words, cache=_cache, **options))
+            for key, words in chunk]
+
+
+def _chunks(pairs, chunksize):
+    pairs = iter(pairs)
+    chunk = list(islice(pairs, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(islice(pairs, chunksize))
+
+
+def run(pairs, kinds=(WORD, SYN), betweenness=False, cycles=False,
+        summary=False, workers=None, chunksize=100, cache=None,
+        regex=r"\W+", **kwargs):
+    """
+    Yields (key, result) pairs, where result is the output of build(), for
+    (key, words) pairs, in the order they were given.
+
+    Parameter pairs: the keys and words of the Poems.
+    Precondition: pairs is an iterable of (key, list of strings) pairs (a
+    generator is fine).
+    Parameter kinds, betweenness, cycles, summary: as for build().
+    Parameter workers: the number of worker processes (None for one per CPU,
+    1 to build in this process).
+    Precondition: workers is a positive int or None.
+    Parameter chunksize: the number of Poems sent to a worker at a time.
+    Precondition: chunksize is a positive int.
+    Parameter cache: the SynCache the words of each chunk are looked up in
+    before it is sent (None for the shared one).
+    Precondition: cache is a SynCache or None.
+    Parameter regex: the regular expression SynGraph applies to words.
+    Precondition: regex is a valid regular expression.
+
+    Additional keyword arguments are passed to SynGraph.
+    """
+    if cache is None:
+        cache = get_cache()
+    options = dict(kwargs, kinds=kinds, betweenness=betweenness,
+                   cycles=cycles, summary=summary, regex=regex)
+    workers = workers or os.cpu_count() or 1
+    try:
+        if workers == 1:
+            for key, words in pairs:
+                yield key, build(words, cache=cache, **options)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = _chunks(pairs, chunksize)
+            pending = [_submit(pool, chunk, cache, options, regex)
+                       for chunk in islice(chunks, 2 * workers)]
+            while pending:
+                results = pending.pop(0).result()
+                for chunk in islice(chunks, 1):
+                    pending.append(_submit(pool, chunk, cache, options,
+                                           regex))
+                yield from results
+    finally:
+        # New lookups are saved however the run ends
+        cache.flush()
+
+
+def _submit(pool, chunk, cache, options, regex):
+    """
+    Submits a chunk to pool with the SynCache entries of its words.
+    """
+    entries = {}
+    if SYN in options["kinds"]:
+        words = {re.sub(regex, "", word) for key, ws in chunk for word in ws}
+        words.discard("")
+        entries = cache.entries(words)
+    return pool.submit(_build_chunk, chunk, entries, options)
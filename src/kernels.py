@@ -0,0 +1,118 @@
+"""
+Graph kernels: a fast, deterministic alternative to graph edit distance.
+
+Every graph is embedded once as a sparse vector of feature counts, and the
+similarity of two graphs is the cosine of their vectors, so a whole Book
+needs one sparse matrix product instead of one NP-hard search per pair.
+
+Two embeddings are available:
+    "wl": Weisfeiler-Lehman subtree features. Nodes start labelled by their
+    degree (or by their word, if labels is True), and every iteration
+    relabels each node by its label and the multiset of its neighbors'
+    labels. Two graphs share a feature when they share a rooted subtree.
+    "hist": a histogram of node degrees and, for SynGraphs, of the synsets
+    that label their edges.
+"""
+from collections import Counter
+import warnings
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+
+WL = "wl"
+HIST = "hist"
+
+
+def wl_features(g, iterations=3, labels=False):
+    """
+    Returns a Counter of the Weisfeiler-Lehman subtree features of g.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    Parameter iterations: the number of relabelling iterations (the depth
+    of the subtrees).
+    Precondition: iterations is a positive int.
+    Parameter labels: Whether nodes start labelled by their word (True) or
+    their degree (False).
+    Precondition: labels is a bool.
+    """
+    features = Counter()
+    if labels:
+        g = g.copy()
+        nx.set_node_attributes(g, {node: str(node) for node in g}, "_label")
+        features.update("0:" + str(node) for node in g)
+        attr = "_label"
+    else:
+        features.update("0:" + str(d) for n, d in g.degree())
+        attr = None
+    with warnings.catch_warnings():
+        # networkx 3.5 warns that its hashes changed from earlier versions
+        warnings.simplefilter("ignore", UserWarning)
+        hashes = nx.weisfeiler_lehman_subgraph_hashes(g, node_attr=attr,
+                                                      iterations=iterations)
+    for node_hashes in hashes.values():
+        features.update("{}:{}".format(i, h)
+                        for i, h in enumerate(node_hashes, 1))
+    return features
+
+
+def hist_features(g):
+    """
+    Returns a Counter of the degrees of g's nodes and the synsets of its
+    edges.
+
+    Parameter g: the graph.
+    Precondition: g is a networkx graph.
+    """
+    features = Counter("deg:" + str(d) for n, d in g.degree())
+    for u, v, synset in g.edges(data="synset"):
+        if synset is not None:
+            features["syn:" + synset] += 1
+    return features
+
+
+def embed(graphs, method=WL, iterations=3, labels=False):
+    """
+    Returns a sparse len(graphs) x features CSR matrix of feature counts.
+
+    Parameter graphs: the graphs to embed.
+    Precondition: graphs is a list of networkx graphs.
+    Parameter method: "wl" or "hist".
+    Precondition: method is a string.
+    Parameter iterations, labels: as for wl_features().
+    """
+    if method not in (WL, HIST):
+        raise ValueError("method must be 'wl' or 'hist'")
+    vocab = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for g in graphs:
+        if method == WL:
+            features = wl_features(g, iterations, labels)
+        else:
+            features = hist_features(g)
+        for feature, count in features.items():
+            indices.append(vocab.setdefault(feature, len(vocab)))
+            data.append(count)
+        indptr.append(len(indices))
+    return csr_matrix((np.asarray(data, dtype=np.float64), indices, indptr),
+                      shape=(len(graphs), len(vocab)))
+
+
+def similarity(matrix):
+    """
+    Returns the dense matrix of cosine similarities between the rows of a
+    feature matrix. Empty graphs are similar only to each other.
+
+    Parameter matrix: the embedded graphs.
+    Precondition: matrix is a sparse matrix returned by embed().
+    """
+    gram = (matrix @ matrix.T).toarray()
+    norms = np.sqrt(np.diag(gram))
+    empty = norms == 0
+    norms[empty] = 1.0
+    gram /= np.outer(norms, norms)
+    gram[np.ix_(empty, empty)] = 1.0
+    np.clip(gram, 0.0, 1.0, out=gram)
+    return gram
@@ -0,0 +1,385 @@
+"""
+Lightweight instrumentation for Poets and bashobot.
+
+Counters, gauges and latency histograms live in a Registry (by default the
+shared REGISTRY). Code is instrumented with spans:
+
+    with metrics.span("generate"):
+        ...
+
+A span records its duration in the histogram basho_<name>_seconds, counts
+failures by exception class in basho_errors_total, tracks how many spans of
+its kind are running in basho_<name>_inflight, and calls every hook added with
+add_hook(). The registry renders itself in the Prometheus text format, which
+serve() exposes on a local http endpoint and log_every() writes to a logger
+periodically. monitor_loop() measures how late an asyncio event loop runs its
+callbacks, and how many tasks are waiting in it.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import functools
+import logging
+import threading
+import time
+
+# Upper bounds in seconds of the buckets of latency histograms
+LATENCY = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, 30.0)
+
+# Upper bounds of the buckets of token count histograms
+TOKENS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+class _Histogram(object):
+    """
+    Bucketed observations of one labelled series.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """
+    A thread-safe collection of counters, gauges and histograms.
+    """
+
+    def __init__(self, prefix="basho_"):
+        """
+        Parameter prefix: prepended to the name of every span's metrics.
+        Precondition: prefix is a string.
+        """
+        self.prefix = prefix
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._hooks = []
+
+    def inc(self, name, value=1, **labels):
+        """
+        Adds value to the counter name with the given labels.
+        """
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Sets the gauge name with the given labels to value.
+        """
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add(self, name, value, **labels):
+        """
+        Adds value (which may be negative) to the gauge name.
+        """
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY, **labels):
+        """
+        Records value in the histogram name with the given labels.
+
+        Parameter buckets: the upper bounds of the histogram's buckets, used
+        when the series is first seen.
+        Precondition: buckets is a sorted tuple of numbers.
+        """
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def describe(self, name, text):
+        """
+        Sets the help text of the metric name.
+        """
+        self._help[name] = text
+
+    def add_hook(self, hook):
+        """
+        Adds a function called as hook(name, seconds, error, labels) at the
+        end of every span, where error is the exception that ended it or
+        None. Exceptions raised by hooks are logged and otherwise ignored.
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Times the body of a with statement as the span name.
+
+        Parameter name: the name of the span, e.g. "generate".
+        Precondition: name is a string of letters, digits and underscores.
+
+        Additional keyword arguments are labels of the span's metrics.
+        """
+        if not self.enabled:
+            yield
+            return
+        metric = self.prefix + name
+        self.add(metric + "_inflight", 1, **labels)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(metric + "_inflight", -1, **labels)
+            self.observe(metric + "_seconds", seconds, **labels)
+            if error is not None and not isinstance(error,
+                                                    GeneratorExit):
+                self.inc(self.prefix + "errors_total", span=name,
+                         error=type(error).__name__)
+            for hook in list(self._hooks):
+                try:
+                    hook(name, seconds, error, labels)
+                except Exception:
+                    logging.getLogger(__name__).exception("Metrics hook "
+                                                          "failed")
+
+    def timed(self, name, **labels):
+        """
+        Returns a decorator that runs a function, or coroutine function, in
+        the span name.
+        """
+        def decorate(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.span(name, **labels):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.span(name, **labels):
+                        return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        """
+        Returns a dictionary of the current values: counters and gauges as
+        {(name, labels): value}, and histograms as {(name, labels): (count,
+        sum)}.
+        """
+        with self._lock:
+            return {"counters": dict(self._counters),
+                    "gauges": dict(self._gauges),
+                    "histograms": {key: (h.count, h.sum) for key, h
+                                   in self._histograms.items()}}
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items(),
+                                key=lambda item: item[0])
+            for kind, series in (("counter", counters), ("gauge", gauges)):
+                seen = set()
+                for (name, labels), value in series:
+                    if name not in seen:
+                        seen.add(name)
+                        self._header(lines, name, kind)
+                    lines.append("{}{} {}".format(name, _format(labels),
+                                                  _number(value)))
+            seen = set()
+            for (name, labels), h in histograms:
+                if name not in seen:
+                    seen.add(name)
+                    self._header(lines, name, "histogram")
+                total = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    total += count
+                    bucket = labels + (("le", _number(bound)),)
+                    lines.append("{}_bucket{} {}".format(name,
+                                                         _format(bucket),
+                                                         total))
+                lines.append("{}_sum{} {}".format(name, _format(labels),
+                                                  _number(h.sum)))
+                lines.append("{}_count{} {}".format(name, _format(labels),
+                                                    h.count))
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append("# HELP {} {}".format(name, self._help[name]))
+        lines.append("# TYPE {} {}".format(name, kind))
+
+    def reset(self):
+        """
+        Forgets every recorded value.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels):
+    if not labels:
+        return ""
+    pairs = ('{}="{}"'.format(key, value.replace("\\", "\\\\")
+                              .replace('"', '\\"').replace("\n", "\\n"))
+             for key, value in labels)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+# The registry used by basho's own instrumentation
+REGISTRY = Registry()
+span = REGISTRY.span
+timed = REGISTRY.timed
+inc = REGISTRY.inc
+add = REGISTRY.add
+observe = REGISTRY.observe
+add_hook = REGISTRY.add_hook
+
+
+class MetricsServer(object):
+    """
+    A background http server that serves a registry at /metrics.
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9100):
+        """
+        Parameter registry: the registry to serve.
+        Precondition: registry is a Registry.
+        Parameter host: the address to listen on.
+        Precondition: host is a string.
+        Parameter port: the port to listen on (0 picks a free one).
+        Precondition: port is an int.
+        """
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/metrics".format(host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def serve(port=9100, host="127.0.0.1", registry=REGISTRY):
+    """
+    Starts serving registry at http://host:port/metrics in a background
+    thread, and returns the MetricsServer.
+    """
+    return MetricsServer(registry, host, port).start()
+
+
+def log_every(interval, logger=None, registry=REGISTRY):
+    """
+    Starts a daemon thread that writes registry to logger every interval
+    seconds, and returns a threading.Event that stops it when set.
+
+    Parameter interval: the number of seconds between dumps.
+    Precondition: interval is a positive number.
+    Parameter logger: the logger (None for this module's).
+    Precondition: logger is a logging.Logger or None.
+    """
+    logger = logger or logging.getLogger(__name__)
+    stop = threading.Event()
+
+    def dump():
+        while not stop.wait(interval):
+            logger.info("metrics\n%s", registry.render())
+
+    threading.Thread(target=dump, daemon=True).start()
+    return stop
+
+
+async def monitor_loop(interval=1.0, registry=REGISTRY):
+    """
+    Measures the event loop it runs in until cancelled: how much later than
+    asked a sleep of interval seconds wakes up (in the histogram
+    basho_loop_lag_seconds) and how many tasks are pending (in the gauge
+    basho_loop_tasks).
+
+    Parameter interval: the number of seconds between measurements.
+    Precondition: interval is a positive number.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        registry.observe(registry.prefix + "loop_lag_seconds",
+                         max(loop.time() - start - interval, 0.0))
+        registry.set(registry.prefix + "loop_tasks",
+                     len(asyncio.all_tasks(loop)))
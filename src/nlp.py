@@ -0,0 +1,161 @@
+"""
+A batch pipeline that tokenizes, POS-tags and labels the Poems of a Book.
+
+Poems are sent to a process pool in chunks of plain strings. Each worker loads
+nltk's tagger once, and tags a whole chunk with one tag_sents() call instead
+of calling pos_tag() once per Poem. Results stream back chunk by chunk, with
+only a bounded number of chunks in flight, so memory use does not grow with
+the size of the Book.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from nltk import word_tokenize
+
+# The tagger of a worker process, loaded once by _init_worker.
+_tagger = None
+
+
+def _load_tagger():
+    """
+    Returns nltk's default English POS tagger.
+    """
+    from nltk.tag import PerceptronTagger
+    return PerceptronTagger()
+
+
+def _init_worker():
+    """
+    Loads the tagger in a worker process.
+    """
+    global _tagger
+    _tagger = _load_tagger()
+
+
+def label(tagged):
+    """
+    Returns the first singular noun of a tagged Poem (as Poem.poet_label
+    does), or None.
+
+    Parameter tagged: the tagged words of a Poem.
+    Precondition: tagged is a list of (word, tag) pairs.
+    """
+    for word, tag in tagged:
+        if tag == "NN":
+            return word
+    return None
+
+
+def process(texts, tokenize=True, tag=True):
+    """
+    Returns a list of (words, tagged, label) tuples for a chunk of texts.
+    tagged and label are None if tag is False.
+
+    Parameter texts: the texts of the Poems.
+    Precondition: texts is a list of strings.
+    Parameter tokenize: Whether texts are tokenized with nltk (True) or split
+    on whitespace (False).
+    Precondition: tokenize is a bool.
+    Parameter tag: Whether the words are tagged.
+    Precondition: tag is a bool.
+    """
+    global _tagger
+    if tokenize:
+        words = [word_tokenize(text) for text in texts]
+    else:
+        words = [text.split() for text in texts]
+    if not tag:
+        return [(w, None, None) for w in words]
+    if _tagger is None:
+        _tagger = _load_tagger()
+    tagged = _tagger.tag_sents(words)
+    return [(w, t, label(t)) for w, t in zip(words, tagged)]
+
+
+def _chunks(items, chunksize):
+    """
+    Yields lists of at most chunksize items.
+    """
+    items = iter(items)
+    chunk = list(islice(items, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(islice(items, chunksize))
+
+
+def run(pairs, tokenize=True, tag=True, workers=None, chunksize=500,
+        inflight=None, progress=None):
+    """
+    Yields (key, (words, tagged, label)) pairs for (key, text) pairs, in the
+    order they were given.
+
+    Parameter pairs: the keys and texts of the Poems.
+    Precondition: pairs is an iterable of (key, string) pairs (a generator is
+    fine).
+    Parameter tokenize, tag: as for process().
+    Parameter workers: the number of worker processes. If None, one per CPU
+    is used, and if 1, chunks are processed in this process.
+    Precondition: workers is a positive int or None.
+    Parameter chunksize: the number of Poems sent to a worker at a time.
+    Precondition: chunksize is a positive int.
+    Parameter inflight: the most chunks submitted at once (twice the number
+    of workers if None).
+    Precondition: inflight is a positive int or None.
+    Parameter progress: called with the number of Poems done after every
+    chunk.
+    Precondition: progress is a function or None.
+    """
+    workers = workers or os.cpu_count() or 1
+    inflight = inflight or 2 * workers
+    chunks = _chunks(pairs, chunksize)
+    done = 0
+    if workers == 1:
+        for chunk in chunks:
+            keys = [key for key, text in chunk]
+            results = process([text for key, text in chunk], tokenize, tag)
+            yield from zip(keys, results)
+            done += len(keys)
+            if progress is not None:
+                progress(done)
+        return
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker if tag else None) as pool:
+        pending = []
+        for chunk in islice(chunks, inflight):
+            pending.append(_submit(pool, chunk, tokenize, tag))
+        while pending:
+            keys, future = pending.pop(0)
+            results = future.result()
+            for chunk in islice(chunks, 1):
+                pending.append(_submit(pool, chunk, tokenize, tag))
+            yield from zip(keys, results)
+            done += len(keys)
+            if progress is not None:
+                progress(done)
+
+
+def _submit(pool, chunk, tokenize, tag):
+    """
+    Submits a chunk of (key, text) pairs to pool, and returns a tuple of the
+    keys and the future.
+    """
+    keys = [key for key, text in chunk]
+    future = pool.submit(process, [text for key, text in chunk], tokenize,
+                         tag)
+    return keys, future
+
+
+def report(total, out=sys.stderr):
+    """
+    Returns a progress function for run() that writes "done/total" to out.
+
+    Parameter total: the number of Poems.
+    Precondition: total is an int.
+    """
+    def progress(done):
+        out.write("\rtagged {}/{}".format(done, total))
+        if done >= total:
+            out.write("\n")
+        out.flush()
+    return progress
@@ -1,6 +1,7 @@
+from collections import Counter
 from basho.src.bgraph import bGraph
 import networkx as nx
-import networkx.algorithms as algs
+from basho.src import cycles
 
 
 class WordGraph(bGraph):
@@ -8,32 +9,94 @@ class WordGraph(bGraph):
     An instance is a DiGraph of words from a set of Poems.
     """
 
-    def __init__(self, poems):
+    def __init__(self, poems=()):
+        """
+        Initializer for the WordGraph class.
+
+        Parameter poems: the Poems from which to construct the WordGraph.
+        Precondition: poems is an iterable of Poems (a generator is fine).
+        """
         super(WordGraph, self).__init__()
         self._g = nx.DiGraph()
-        for p in poems:
+        self.add_poems(poems)
+
+    def add_poems(self, poems, batch=10000):
+        """
+        Adds words and bigrams from Poems to the graph.
+
+        Node occurrences and edge weights are counted in bulk with Counters,
+        batch Poems at a time, and merged into the graph with a single
+        add_nodes_from/add_edges_from per batch. The graph can be updated this
+        way whenever new Poems arrive.
+
+        Parameter poems: the Poems to add.
+        Precondition: poems is an iterable of Poems (a generator is fine).
+        Parameter batch: the number of Poems counted before each merge.
+        Precondition: batch is a positive int.
+        """
+        unigrams = Counter()
+        bigrams = Counter()
+        for i, p in enumerate(poems, 1):
             words = p.get_words()
-            for i in range(len(words)):
-                if i == 0:
-                    if words[i] not in self._g:
-                        self._g.add_node(words[i], occurrences=1)
-                    else:
-                        self._g.nodes[words[i]]["occurrences"] += 1
-                else:
-                    if words[i] not in self._g:
-                        self._g.add_node(words[i], occurrences=1)
-                        self._g.add_edge(words[i-1], words[i], weight=1)
-                    else:
-                        self._g.nodes[words[i]]["occurrences"] += 1
-                        if words[i-1] in self._g.predecessors(words[i]):
-                            self._g.edges[words[i-1], words[i]]["weight"] += 1
-                        else:
-                            self._g.add_edge(words[i-1], words[i], weight=1)
-
-    def update_betweenness(self):
-        """
-        Updates betweenness centrality for all nodes in the graph.
-        """
-        betweenness = algs.betweenness_centrality(self._g)
+            unigrams.update(words)
+            bigrams.update(zip(words, words[1:]))
+            if i % batch == 0:
+                self.merge(unigrams, bigrams)
+                unigrams = Counter()
+                bigrams = Counter()
+        self.merge(unigrams, bigrams)
+
+    def merge(self, unigrams, bigrams):
+        """
+        Merges word and bigram counts into the graph, e.g. counts made
+        elsewhere from words that are not in Poems.
+
+        Parameter unigrams: the number of occurrences of each word.
+        Precondition: unigrams is a mapping of strings to ints.
+        Parameter bigrams: the number of occurrences of each pair of
+        consecutive words.
+        Precondition: bigrams is a mapping of (string, string) to ints.
+        """
+        nodes = self._g.nodes
+        new_nodes = []
+        for word, count in unigrams.items():
+            if word in nodes:
+                nodes[word]["occurrences"] += count
+            else:
+                new_nodes.append((word, {"occurrences": count}))
+        self._g.add_nodes_from(new_nodes)
+        adj = self._g.adj
+        new_edges = []
+        for (u, v), count in bigrams.items():
+            if v in adj[u]:
+                adj[u][v]["weight"] += count
+            else:
+                new_edges.append((u, v, {"weight": count}))
+        self._g.add_edges_from(new_edges)
+
+    def find_cycles(self, length=None, limit=None, timeout=None,
+                    store=False):
+        """
+        Returns the dictionary of cycles.find() for the graph. By default
+        cycles are only counted, since a WordGraph of many Poems can have
+        too many to store.
+
+        Parameters are the same as for cycles.find().
+        """
+        return cycles.find(self._g, length=length, limit=limit,
+                           timeout=timeout, store=store)
+
+    def update_betweenness(self, k=None, seed=None, workers=1):
+        """
+        Updates betweenness centrality for all nodes in the graph. With k, it
+        is estimated from k sampled sources, and every node also gets a
+        "betweenness_error" (the standard error of the estimate).
+
+        Parameters are the same as for bGraph.betweenness().
+        """
+        betweenness, errors = self.betweenness(k=k, seed=seed,
+                                               workers=workers, errors=True)
         for key in betweenness:
             self._g.nodes[key]["betweenness"] = betweenness[key]
+            if errors is not None:
+                self._g.nodes[key]["betweenness_error"] = errors[key]
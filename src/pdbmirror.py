@@ -0,0 +1,254 @@
+"""
+Local storage for PoetryDB, so repeated queries do not go to the network.
+
+ResponseCache keeps raw PoetryDB responses by url in sqlite. Fresh entries are
+served directly, and stale ones are revalidated with their ETag. PdbMirror
+holds a copy of the whole PoetryDB corpus in an indexed sqlite file and answers
+author/title/lines/linecount/poemcount queries (including ":abs") locally.
+Both plug into PdbWrangler:
+
+    mirror = PdbMirror("poetrydb.sqlite")
+    mirror.download(PdbWrangler())
+    poems = PdbWrangler(mirror=mirror).get_poems(author="Emily Dickinson")
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote
+
+SEARCH_FIELDS = ("author", "title", "lines", "linecount")
+
+
+class ResponseCache(object):
+    """
+    An on-disk cache of PoetryDB responses keyed by url.
+    """
+
+    def __init__(self, path, ttl=86400):
+        """
+        Parameter path: the sqlite file (":memory:" for an in-memory cache).
+        Precondition: path is a string.
+        Parameter ttl: the number of seconds a response is served without
+        revalidation.
+        Precondition: ttl is a number.
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT "
+                         "PRIMARY KEY, etag TEXT, body TEXT, fetched REAL)")
+        self._db.commit()
+
+    def get(self, url):
+        """
+        Returns a tuple (body, etag, fresh) for url, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT body, etag, fetched FROM "
+                                   "responses WHERE url = ?",
+                                   (url,)).fetchone()
+        if row is None:
+            return None
+        body, etag, fetched = row
+        return body, etag, time.time() - fetched < self.ttl
+
+    def put(self, url, body, etag=None):
+        """
+        Stores a response body for url.
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES "
+                             "(?, ?, ?, ?)", (url, etag, body, time.time()))
+            self._db.commit()
+
+    def touch(self, url):
+        """
+        Marks the response for url as fresh again.
+        """
+        with self._lock:
+            self._db.execute("UPDATE responses SET fetched = ? WHERE url = ?",
+                             (time.time(), url))
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class PdbMirror(object):
+    """
+    A local, indexed copy of PoetryDB that answers queries offline.
+    """
+
+    def __init__(self, path):
+        """
+        Parameter path: the sqlite file (":memory:" for an in-memory mirror).
+        Precondition: path is a string.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS poems (id INTEGER PRIMARY KEY,
+                author TEXT, title TEXT, lines TEXT, linecount INTEGER,
+                UNIQUE (author, title));
+            CREATE TABLE IF NOT EXISTS lines (poem INTEGER, line TEXT);
+            CREATE INDEX IF NOT EXISTS poems_author ON poems (author);
+            CREATE INDEX IF NOT EXISTS poems_title ON poems (title);
+            CREATE INDEX IF NOT EXISTS poems_linecount ON poems (linecount);
+            CREATE INDEX IF NOT EXISTS lines_line ON lines (line);
+        """)
+        self._db.commit()
+
+    def download(self, wrangler, authors=None):
+        """
+        Copies every poem by the given authors from PoetryDB into the mirror.
+
+        Parameter wrangler: the wrangler used to reach PoetryDB.
+        Precondition: wrangler is a PdbWrangler without a mirror.
+        Parameter authors: the authors to copy. If None, every author is.
+        Precondition: authors is an iterable of strings or None.
+        """
+        if authors is None:
+            authors = wrangler.get_authors()
+        queries = ({"author": author, "abs": True} for author in authors)
+        for query, poems_json in wrangler.fetch_many(queries):
+            self.add(poems_json)
+
+    def add(self, poems_json):
+        """
+        Adds poems in PoetryDB's json format to the mirror.
+
+        Parameter poems_json: the poems to add.
+        Precondition: poems_json is a list of dictionaries with "title",
+        "author", "lines" and "linecount" keys.
+        """
+        with self._lock:
+            for poem in poems_json:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO poems (author, title, lines, "
+                    "linecount) VALUES (?, ?, ?, ?)",
+                    (poem["author"], poem["title"], json.dumps(poem["lines"]),
+                     int(poem["linecount"])))
+                if cursor.rowcount:
+                    self._db.executemany(
+                        "INSERT INTO lines VALUES (?, ?)",
+                        [(cursor.lastrowid, line) for line in poem["lines"]])
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM poems").fetchone()[0]
+
+    def authors(self):
+        """
+        Returns a sorted list of the authors in the mirror.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT author FROM poems ORDER "
+                                    "BY author").fetchall()
+        return [row[0] for row in rows]
+
+    def query(self, author=None, title=None, lines=None, linecount=None,
+              poemcount=None, abs=False):
+        """
+        Returns the poems matching a search, in PoetryDB's json format.
+
+        Matching follows PoetryDB: a term matches as a case-insensitive
+        substring, or exactly if abs is True (or the term ends in ":abs"), and
+        linecount always matches exactly.
+
+        Parameters are the same as for PdbWrangler.get_poems().
+        """
+        terms = {"author": author, "title": title, "lines": lines,
+                 "linecount": linecount}
+        where = []
+        params = []
+        for field in SEARCH_FIELDS:
+            term = terms[field]
+            if term is None:
+                continue
+            term = str(term)
+            exact = abs
+            if term.endswith(":abs"):
+                term = term[:-len(":abs")]
+                exact = True
+            if field == "linecount":
+                where.append("linecount = ?")
+                params.append(int(term))
+            elif field == "lines" and exact:
+                where.append("id IN (SELECT poem FROM lines WHERE line = ?)")
+                params.append(term)
+            elif field == "lines":
+                where.append("id IN (SELECT poem FROM lines WHERE line LIKE "
+                             "? ESCAPE '\\')")
+                params.append(_like(term))
+            elif exact:
+                where.append(field + " = ?")
+                params.append(term)
+            else:
+                where.append(field + " LIKE ? ESCAPE '\\'")
+                params.append(_like(term))
+        sql = "SELECT author, title, lines, linecount FROM poems"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+        if poemcount is not None:
+            sql += " LIMIT ?"
+            params.append(int(str(poemcount).replace(":abs", "")))
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [_to_json(row) for row in rows]
+
+    def random(self, num):
+        """
+        Returns num random poems in PoetryDB's json format.
+        """
+        with self._lock:
+            ids = [row[0] for row in self._db.execute("SELECT id FROM poems")]
+            chosen = random.sample(ids, min(num, len(ids)))
+            rows = [self._db.execute("SELECT author, title, lines, linecount "
+                                     "FROM poems WHERE id = ?",
+                                     (i,)).fetchone() for i in chosen]
+        return [_to_json(row) for row in rows]
+
+    def answer(self, path):
+        """
+        Returns the json PoetryDB would return for a url path such as
+        "author,title/Shakespeare;Sonnet" or "random/5".
+
+        Parameter path: the part of a PoetryDB url after the base url.
+        Precondition: path is a string.
+        """
+        parts = [part for part in path.split("/") if part]
+        if parts == ["author"]:
+            return {"authors": self.authors()}
+        if len(parts) == 2 and parts[0] == "random":
+            return self.random(int(parts[1]))
+        if len(parts) < 2:
+            return []
+        terms = [unquote(term) for term in parts[1].split(";")]
+        return self.query(**dict(zip(parts[0].split(","), terms)))
+
+    def close(self):
+        self._db.close()
+
+
+def _like(term):
+    """
+    Returns a LIKE pattern matching term as a substring.
+    """
+    term = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return "%" + term + "%"
+
+
+def _to_json(row):
+    """
+    Converts a row of the poems table to PoetryDB's json format.
+    """
+    author, title, lines, linecount = row
+    return {"title": title, "author": author, "lines": json.loads(lines),
+            "linecount": str(linecount)}
@@ -5,16 +5,61 @@ https://github.com/thundercomb/poetrydb/blob/master/README.md
 
 """
 from basho.src.poem import Poem
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json
 import requests
 
 
 class PdbWrangler(object):
     """
     This class provides a straightforward way to deal with the PoetryDB api.
+
+    Requests share one pooled requests.Session, time out after timeout
+    seconds, and are retried with exponential backoff on connection errors
+    and 429/5xx responses.
     """
 
-    def __init__(self):
-        self._baseUrl = "https://poetrydb.org/"
+    def __init__(self, base_url="https://poetrydb.org/", workers=8, timeout=10,
+                 retries=3, backoff=0.5, cache=None, mirror=None):
+        """
+        Parameter base_url: the PoetryDB server, e.g. a local stub for tests.
+        Precondition: base_url is a string.
+        Parameter workers: the number of concurrent requests of bulk queries.
+        Precondition: workers is a positive int.
+        Parameter timeout: the timeout in seconds of each request.
+        Precondition: timeout is a number.
+        Parameter retries: the number of times a request is retried.
+        Precondition: retries is an int.
+        Parameter backoff: the backoff factor in seconds between retries.
+        Precondition: backoff is a number.
+        Parameter cache: a cache of responses by url. Random poems are never
+        cached.
+        Precondition: cache is a ResponseCache or None.
+        Parameter mirror: a local copy of PoetryDB. If given, every query is
+        answered from it and the network is never used.
+        Precondition: mirror is a PdbMirror or None.
+        """
+        if not base_url.endswith("/"):
+            base_url += "/"
+        self._baseUrl = base_url
+        self._d = " % "
+        self.workers = workers
+        self.timeout = timeout
+        self.errors = []
+        self.cache = cache
+        self.mirror = mirror
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers,
+                              max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
     def get_poems(self, author=None, title=None, lines=None, linecount=None,
                   poemcount=None, abs=False, d=" % ", **kwargs):
@@ -36,6 +81,90 @@ class PdbWrangler(object):
         to the poetrydb api docs for more on how abs is handled.
         """
         self._d = d
+        url = self._url(author, title, lines, linecount, poemcount, abs)
+        poems_json = self._get_json(url)
+        poems = self._to_poem(poems_json, d=d, **kwargs)
+        return poems
+
+    def get_poems_many(self, queries, d=" % ", **kwargs):
+        """
+        Yields Poems matching any of several queries, as responses arrive.
+
+        Queries run concurrently on the wrangler's workers. A query that
+        still fails after retries is skipped and recorded as a (query,
+        exception) pair in the errors attribute.
+
+        Parameter queries: the queries to run.
+        Precondition: queries is an iterable of dictionaries of get_poems()
+        search parameters (author, title, lines, linecount, poemcount, abs).
+        Parameter d: The delimiter to use between lines in the Poems.
+        Precondition: d is a string.
+
+        Additional keyword arguments are passed to Poem.
+        """
+        self._d = d
+        for query, poems_json in self.fetch_many(queries):
+            for poem in self._to_poem(poems_json, d=d, **kwargs):
+                yield poem
+
+    def fetch_many(self, queries):
+        """
+        Yields (query, json) pairs for several queries, as responses arrive.
+
+        Parameters and error handling are the same as for get_poems_many().
+        """
+        queries = iter(queries)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {}
+        try:
+            # At most workers requests are submitted ahead of the consumer,
+            # so a consumer that stops early does not wait for the rest
+            for query in islice(queries, self.workers):
+                url = self._url(**query)
+                futures[pool.submit(self._get_json, url)] = query
+            while futures:
+                done = wait(futures, return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    query = futures.pop(future)
+                    for new in islice(queries, 1):
+                        url = self._url(**new)
+                        futures[pool.submit(self._get_json, url)] = new
+                    try:
+                        poems_json = future.result()
+                    except Exception as e:
+                        self.errors.append((query, e))
+                        continue
+                    yield query, poems_json
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_authors(self):
+        """
+        Returns a list of every author in PoetryDB.
+        """
+        return self._get_json(self._baseUrl + "author").get("authors", [])
+
+    def crawl_authors(self, authors=None, d=" % ", **kwargs):
+        """
+        Yields every Poem by the given authors, as responses arrive.
+
+        Parameter authors: the authors to crawl. If None, every author in
+        PoetryDB is crawled.
+        Precondition: authors is an iterable of strings or None.
+
+        Other parameters are the same as for get_poems_many().
+        """
+        if authors is None:
+            authors = self.get_authors()
+        queries = ({"author": author, "abs": True} for author in authors)
+        return self.get_poems_many(queries, d=d, **kwargs)
+
+    def _url(self, author=None, title=None, lines=None, linecount=None,
+             poemcount=None, abs=False):
+        """
+        Returns the PoetryDB url of a search. Parameters are the same as for
+        get_poems().
+        """
         args = {"author": author, "title": title, "lines": lines,
                 "linecount": linecount, "poemcount": poemcount}
         input = []
@@ -44,15 +173,12 @@ class PdbWrangler(object):
             if args[key] is not None:
                 input.append(key)
                 if abs:
-                    search.append(args[key]+":abs")
+                    search.append(str(args[key])+":abs")
                 else:
                     search.append(args[key])
         input = ','.join(input)
-        search = ';'.join([str(x) for x in search])
-        url = self._baseUrl + input + '/' + search
-        poems_json = self._get_json(url)
-        poems = self._to_poem(poems_json, **kwargs)
-        return poems
+        search = ';'.join([quote(str(x), safe=":") for x in search])
+        return self._baseUrl + input + '/' + search
 
     def get_random_poems(self, num, d=" % ", **kwargs):
         """
@@ -65,34 +191,72 @@ class PdbWrangler(object):
         """
         self._d = d
         url = self._baseUrl + "random/" + str(num)
-        poems_json = self._get_json(url)
-        poems = self._to_poem(poems_json, **kwargs)
+        poems_json = self._get_json(url, cache=False)
+        poems = self._to_poem(poems_json, d=d, **kwargs)
         return poems
 
-    def _to_poem(self, json_file, **kwargs):
+    def _to_poem(self, json_file, d=None, **kwargs):
         """
         Converts Json from poetrydb into a set of Poem objects.
 
         Parameter json_file: The Json file to convert.
         Precondition: json_file is a valid Json file generated by poetrydb
-        Parameter delim: The character(s) to place between lines in each poem.
-        Precondition: delim is a string.
+        Parameter d: The character(s) to place between lines in each poem. If
+        None, the delimiter of the last query is used.
+        Precondition: d is a string or None.
         """
+        if d is None:
+            d = self._d
         poems = []
         for i in json_file:
             t = i["title"]
             a = i["author"]
             lines = i["lines"]
-            text = self._d.join(lines)
-            poem = Poem(text.lower(), author=a, title=t, delimiter=self._d,
+            text = d.join(lines)
+            poem = Poem(text.lower(), author=a, title=t, delimiter=d,
                         **kwargs)
             poems.append(poem)
         return poems
 
-    def _get_json(self, url):
+    def _get_json(self, url, cache=True):
         """
         A helper function for fetching json data from poetrydb.
+
+        Queries are answered by the mirror if there is one, then by the cache
+        if it has a fresh response. Stale responses are revalidated with their
+        ETag. PoetryDB answers searches without results with a
+        {"status": 404} object, which is returned as an empty list.
+        """
+        if self.mirror is not None:
+            return self.mirror.answer(url[len(self._baseUrl):])
+        entry = None
+        headers = {}
+        if cache and self.cache is not None:
+            entry = self.cache.get(url)
+            if entry is not None and entry[2]:
+                self.cache.hits += 1
+                return self._not_found(json.loads(entry[0]))
+            if entry is not None and entry[1]:
+                headers["If-None-Match"] = entry[1]
+        data = self._session.get(url, timeout=self.timeout, headers=headers)
+        if data.status_code == 304 and entry is not None:
+            self.cache.revalidated += 1
+            self.cache.touch(url)
+            return self._not_found(json.loads(entry[0]))
+        if data.status_code == 404:
+            return []
+        data.raise_for_status()
+        if cache and self.cache is not None:
+            self.cache.misses += 1
+            self.cache.put(url, data.text, data.headers.get("ETag"))
+        return self._not_found(data.json())
+
+    @staticmethod
+    def _not_found(json_data):
+        """
+        Returns an empty list for PoetryDB's "not found" object, and json_data
+        otherwise.
         """
-        data = requests.get(url)
-        json_data = data.json()
+        if isinstance(json_data, dict) and json_data.get("status") == 404:
+            return []
         return json_data
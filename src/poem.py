@@ -1,8 +1,9 @@
 import networkx as nx
-import networkx.algorithms as algs
+from sys import intern
 from nltk import pos_tag, word_tokenize
 from basho.src.nxwordgraph import WordGraph
 from basho.src.syngraph import SynGraph
+from basho.src import cycles
 
 
 class Poem(object):
@@ -82,7 +83,7 @@ class Poem(object):
         return self._num_cycles
 
     def get_density(self):
-        if self._wg is None:
+        if self.wg is None:
             raise Exception("WordGraph for this Poem does not exist.")
         return self._density
 
@@ -108,6 +109,22 @@ class Poem(object):
     def set_label(self, label):
         self.label = label
 
+    def set_words(self, words, tagged=None):
+        """
+        Sets the words of the Poem, and optionally their POS tags, e.g. from
+        a batch pipeline.
+
+        Parameter words: the words of the Poem.
+        Precondition: words is a list of strings.
+        Parameter tagged: the tagged words (None to leave the tags as they
+        are).
+        Precondition: tagged is a list of (word, tag) pairs or None.
+        """
+        self._words = words
+        self._length = len(words)
+        if tagged is not None:
+            self.tagged = tagged
+
     def gen_wg(self):
         """
         Generate a WordGraph of the Poem.
@@ -117,15 +134,20 @@ class Poem(object):
         self._num_nodes = nx.number_of_nodes(self.wg.get_graph())
         self._density = nx.density(self.wg.get_graph())
 
-    def gen_sg(self, hyp=True):
+    def gen_sg(self, hyp=True, cache=None, **kwargs):
         """
         Generate a SynGraph of the Poem.
 
         Parameter nym: Whether the SynGraph is heteronymic (True) or hyponymic
         (False).
         Precondition: nym is a bool.
+        Parameter cache: the cache of WordNet lookups (None for the shared
+        cache).
+        Precondition: cache is a SynCache or None.
+
+        Additional keyword arguments (e.g. index, hub) are passed to SynGraph.
         """
-        self.sg = SynGraph.from_poem(self, hyp=hyp)
+        self.sg = SynGraph.from_poem(self, hyp=hyp, cache=cache, **kwargs)
         self._num_nodes = nx.number_of_nodes(self.sg.get_graph())
         self._num_edges = nx.number_of_edges(self.sg.get_graph())
 
@@ -149,19 +171,34 @@ class Poem(object):
                 self.label = item[0]
                 return
 
-    def update_cycles(self):
+    def update_cycles(self, length=None, limit=None, timeout=None,
+                      store=True):
         """
-        Updates the number of cycles in the Poem's WordGraph. Raises an
+        Updates the cycles and number of cycles in the Poem's WordGraph, and
+        returns the dictionary of cycles.find(), which also has a histogram
+        of cycle lengths and whether a bound stopped the search. Raises an
         Exception if a WordGraph for the Poem does not exist.
+
+        Parameter length: the longest cycle to find (None for no bound).
+        Precondition: length is a positive int or None.
+        Parameter limit: the most cycles to find (None for no limit).
+        Precondition: limit is a non-negative int or None.
+        Parameter timeout: the number of seconds after which the search stops
+        (None for no timeout).
+        Precondition: timeout is a number or None.
+        Parameter store: Whether to keep the cycles, or only count them.
+        Precondition: store is a bool.
         """
         if self.wg is None:
             raise Exception("WordGraph for this Poem does not exist.")
-        cycle_generator = algs.simple_cycles(self.wg.get_graph())
-        for i in cycle_generator:
-            self._cycles.append(i)
-        self._num_cycles = len(self._cycles)
+        found = cycles.find(self.wg.get_graph(), length=length, limit=limit,
+                            timeout=timeout, store=store)
+        self._cycles = found["cycles"]
+        self._num_cycles = found["count"]
+        return found
 
-    def betweenness(self, syn=True, normal=True):
+    def betweenness(self, syn=True, normal=True, k=None, seed=None,
+                    workers=1):
         """
         Returns a dictionary of betweenness centrality for all nodes in _g.
 
@@ -170,14 +207,146 @@ class Poem(object):
         Precondition: syn is a bool.
         Parameter normal: Whether betweenness is normalized.
         Precondition: normal is a bool.
+        Parameter k: the number of sampled sources for an estimate (None for
+        exact).
+        Precondition: k is a positive int or None.
+        Parameter seed: the seed of the sample.
+        Precondition: seed is an int or None.
+        Parameter workers: the number of worker processes.
+        Precondition: workers is a positive int or None.
         """
         if syn:
             if self.sg is None:
                 raise Exception("SynGraph for this Poem does not exist.")
-            return algs.betweenness_centrality(self.sg.get_graph(),
-                                               normalized=normal)
+            return self.sg.betweenness(normalized=normal, k=k, seed=seed,
+                                       workers=workers)
         else:
             if self.wg is None:
                 raise Exception("WordGraph for this Poem does not exist.")
-            return algs.betweenness_centrality(self.wg.get_graph(),
-                                               normalized=normal)
+            return self.wg.betweenness(normalized=normal, k=k, seed=seed,
+                                       workers=workers)
+
+
+class LeanPoem(object):
+    """
+    A memory-lean Poem for very large Books.
+
+    LeanPoems have no attribute dictionary, share the string objects of
+    repeated words, and compute their words, length, line count and POS tags
+    lazily on first access. get_wg() and get_sg() build the WordGraph and
+    (hypernymic) SynGraph on first access too, instead of raising when they
+    were not generated. Otherwise they behave like Poems, with the same
+    getters and graph methods.
+    """
+
+    __slots__ = ("text", "author", "title", "label", "sg", "wg", "_delimiter",
+                 "_token", "_w", "_n", "_tags", "_density", "_num_nodes",
+                 "_num_edges", "_cyc", "_num_cycles")
+
+    def __init__(self, text, author=None, title=None, label=None,
+                 delimiter=" % ", token=False):
+        """
+        Parameters are the same as for Poem. If token is True, the words
+        are tokenized and tagged with nltk on first access rather than here.
+        """
+        self.text = text.replace("/", delimiter).lower()
+        self.author = author
+        self.title = title
+        self.label = label
+        self.sg = None
+        self.wg = None
+        self._delimiter = delimiter
+        self._token = token
+        self._w = None
+        self._n = None
+        self._tags = None
+        self._density = None
+        self._num_nodes = None
+        self._num_edges = None
+        self._cyc = None
+        self._num_cycles = None
+
+    @property
+    def _words(self):
+        if self._w is None:
+            if self._token:
+                words = word_tokenize(self.text)
+            else:
+                words = self.text.split()
+            self._w = [intern(word) for word in words]
+        return self._w
+
+    @_words.setter
+    def _words(self, words):
+        self._w = words
+
+    def set_words(self, words, tagged=None):
+        """
+        The same as Poem.set_words(), but repeated words share strings.
+        """
+        self._w = [intern(word) for word in words]
+        if tagged is not None:
+            self._tags = [(intern(word), tag) for word, tag in tagged]
+
+    @property
+    def _length(self):
+        return len(self._words)
+
+    @property
+    def _lines(self):
+        if self._n is None:
+            self._n = self.text.count(self._delimiter) + 1
+        return self._n
+
+    @property
+    def tagged(self):
+        if self._tags is None and self._token:
+            self._tags = pos_tag(self._words)
+        return self._tags
+
+    @tagged.setter
+    def tagged(self, tags):
+        self._tags = tags
+
+    def get_sg(self):
+        if self.sg is None:
+            self.gen_sg()
+        return self.sg
+
+    def get_wg(self):
+        if self.wg is None:
+            self.gen_wg()
+        return self.wg
+
+    @property
+    def _cycles(self):
+        if self._cyc is None:
+            self._cyc = []
+        return self._cyc
+
+    @_cycles.setter
+    def _cycles(self, cycles):
+        self._cyc = cycles
+
+    get_text = Poem.get_text
+    get_words = Poem.get_words
+    get_length = Poem.get_length
+    get_author = Poem.get_author
+    get_title = Poem.get_title
+    get_label = Poem.get_label
+    get_cycles = Poem.get_cycles
+    get_num_cycles = Poem.get_num_cycles
+    get_density = Poem.get_density
+    get_num_nodes = Poem.get_num_nodes
+    get_num_edges = Poem.get_num_edges
+    num_lines = Poem.num_lines
+    set_author = Poem.set_author
+    set_title = Poem.set_title
+    set_label = Poem.set_label
+    gen_wg = Poem.gen_wg
+    gen_sg = Poem.gen_sg
+    tokenize = Poem.tokenize
+    tag = Poem.tag
+    poet_label = Poem.poet_label
+    update_cycles = Poem.update_cycles
+    betweenness = Poem.betweenness
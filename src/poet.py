@@ -8,9 +8,20 @@ generate() is called. This also reduces costs.
 import openai
 import os
 import json
+import hashlib
 import random
+import heapq
+from bisect import bisect
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import accumulate, islice
 from basho.src.poem import Poem
 from basho.src.book import Book
+from basho.src.completion import AsyncCompletions
+from basho.src import corpus as store
+from basho.src.corpus import FRAGMENT, JsonlCorpus, count_tokens
+from basho.src import metrics
+from basho.src.retrieval import ExampleIndex
 
 
 class Poet(object):
@@ -27,7 +38,8 @@ class Poet(object):
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
     def __init__(self, header, corpus, engine="davinci", temp=0.75,
-                 max_len=64, tp=0.7, freq_pen=0.6, pres_pen=0.6, file=True):
+                 max_len=64, tp=0.7, freq_pen=0.6, pres_pen=0.6, file=True,
+                 client=None, cache=None):
         """
         Initializer for the Poet class.
 
@@ -37,8 +49,9 @@ class Poet(object):
         Precondition: header is a string (preferably a short one, such as "Writes
         haikus in the style of Basho"
         Parameter corpus: A json file composed of (label, poem) pairs, where poems have
-        lines separated by "/".
-        Precondition: corpus is a valid json file.
+        lines separated by "/". A ".jsonl" file written by corpus.convert() is
+        memory-mapped instead of loaded, and a dictionary is used as is.
+        Precondition: corpus is a valid json or JSONL file, or a dictionary.
         Parameter engine: The OpenAI engine to use to generate the poem.
         Precondition: engine is a valid engine.
         Parameter temp: temperature parameter for OpenAI
@@ -51,6 +64,12 @@ class Poet(object):
         Precondition: freq_pen is a float between 0.0 and 1.0.
         Paramter pres_pen: pres_pen is the presence_penalty paramter for OpenAI.
         Precondition: pres_pen is a float between 0.0 and 1.0.
+        Parameter client: the client used by agenerate(). If None, one is
+        created on first use.
+        Precondition: client is an AsyncCompletions or None.
+        Parameter cache: a cache of completions. If None, every call goes to
+        OpenAI.
+        Precondition: cache is a CompletionCache or None.
         """
         self.header = header + "\n\n"
         self.engine = engine
@@ -59,8 +78,251 @@ class Poet(object):
         self.tp = tp
         self.freq_pen = freq_pen
         self.pres_pen = pres_pen
-        with open(corpus) as json_file:
-            self.corpus = json.load(json_file)
+        self.client = client
+        self.cache = cache
+        self._header_tokens = (None, 0)
+        if isinstance(corpus, Mapping):
+            self.corpus = corpus
+        elif corpus.endswith(".jsonl"):
+            self.corpus = JsonlCorpus(corpus)
+        else:
+            with open(corpus) as json_file:
+                self.corpus = json.load(json_file)
+        self._index_corpus()
+
+    def _index_corpus(self):
+        """
+        Precomputes an indexed array of the corpus keys and the prompt
+        fragment and token count of every example, so prompts can be sampled
+        and assembled without touching the rest of the corpus. A JsonlCorpus
+        already has these on disk, and only the sampled examples are read.
+        """
+        if isinstance(self.corpus, JsonlCorpus):
+            self._keys = self.corpus.keys_list()
+            self._fragments = self.corpus.fragments()
+            self._tokens = self.corpus.tokens()
+            total = self.corpus.total_tokens()
+            digest = self.corpus.digest()
+        else:
+            self._keys = list(self.corpus)
+            self._fragments = [FRAGMENT.format(key, self.corpus[key])
+                               for key in self._keys]
+            self._tokens = [count_tokens(fragment)
+                            for fragment in self._fragments]
+            total = sum(self._tokens)
+            hashed = hashlib.sha256()
+            for fragment in self._fragments:
+                hashed.update(fragment.encode())
+            digest = hashed.hexdigest()
+        self._corpus_digest = digest
+        self._scope = (None, None)
+        self._mean_tokens = total / max(len(self._keys), 1)
+        self._cum_weights = None
+        self._strata = None
+        self._retrieval = None
+
+    def retrieve(self, index=True, syns=False, cache=None):
+        """
+        Makes prompts seed-aware. Instead of being sampled, examples are then
+        the ones most related to the seed: those whose labels and texts share
+        its words, found through an inverted index built here, once. Weights
+        and strata only apply to seeds that match too few examples.
+
+        Parameter index: Whether examples are retrieved (True) or sampled
+        again (False).
+        Precondition: index is a bool.
+        Parameter syns: Whether words also match through their WordNet
+        hypernyms, looked up in a SynCache as SynGraph does.
+        Precondition: syns is a bool.
+        Parameter cache: the cache of WordNet lookups (None for the shared
+        cache).
+        Precondition: cache is a SynCache or None.
+        """
+        if not index:
+            self._retrieval = None
+            return
+        if isinstance(self.corpus, JsonlCorpus):
+            texts = (self.corpus.text_at(i) for i in range(len(self._keys)))
+        else:
+            texts = (self.corpus[key] for key in self._keys)
+        self._retrieval = ExampleIndex(self._keys, texts, syns=syns,
+                                       cache=cache)
+
+    def select(self, size, seed=None):
+        """
+        Returns a list of size distinct indices into the Poet's corpus keys:
+        the examples most related to seed if the Poet retrieves them (see
+        retrieve()), or a sample otherwise.
+
+        Parameter size: the number of examples.
+        Precondition: size is an int, where 0 <= size < corpus.size().
+        Parameter seed: the seed of the poem.
+        Precondition: seed is a string or None.
+        """
+        if self._retrieval is None or seed is None:
+            return self.sample(size)
+        chosen = self._retrieval.top(seed, size, fill=False)
+        if len(chosen) < size:
+            taken = set(chosen)
+            extra = self.sample(min(2 * size, len(self._keys)))
+            chosen.extend(i for i in extra if i not in taken)
+            chosen = chosen[:size]
+        return chosen
+
+    def weigh(self, func=None):
+        """
+        Makes sampling weighted. Examples are then drawn with probability
+        proportional to their weight, without replacement.
+
+        Parameter func: a function from (key, text) to a positive weight, e.g.
+        lambda key, text: 1 / len(text) to favor short examples. If None,
+        sampling is uniform again.
+        Precondition: func is a function or None.
+        """
+        if func is None:
+            self._cum_weights = None
+            return
+        weights = [func(key, self.corpus[key]) for key in self._keys]
+        self._cum_weights = list(accumulate(weights))
+
+    def stratify(self, func=None, proportional=False):
+        """
+        Makes sampling stratified. Examples are grouped by func, and each
+        prompt draws from the groups evenly (or in proportion to their size if
+        proportional is True).
+
+        Parameter func: a function from (key, text) to a group, e.g.
+        lambda key, text: text.count("/") to stratify by number of lines. If
+        None, sampling is no longer stratified.
+        Precondition: func is a function or None.
+        Parameter proportional: Whether groups are sampled in proportion to
+        their size.
+        Precondition: proportional is a bool.
+        """
+        if func is None:
+            self._strata = None
+            return
+        groups = {}
+        for i, key in enumerate(self._keys):
+            groups.setdefault(func(key, self.corpus[key]), []).append(i)
+        self._strata = (list(groups.values()), proportional)
+
+    def sample(self, size):
+        """
+        Returns a list of size distinct indices into the Poet's corpus keys,
+        using the Poet's weights or strata if it has them.
+
+        Uniform samples take O(size) time.
+
+        Parameter size: the number of examples to be sampled from the corpus.
+        Precondition: size is an int, where 0 <= size < corpus.size().
+        """
+        if self._strata is not None:
+            return self._sample_strata(size)
+        if self._cum_weights is not None:
+            return self._sample_weighted(size)
+        return random.sample(range(len(self._keys)), size)
+
+    def _sample_weighted(self, size):
+        """
+        Draws size distinct weighted indices by bisecting the cumulative
+        weights, redrawing duplicates.
+        """
+        cum = self._cum_weights
+        total = cum[-1]
+        chosen = {}
+        tries = 0
+        while len(chosen) < size and tries < 8 * size + 32:
+            chosen[bisect(cum, random.random() * total)] = None
+            tries += 1
+        if len(chosen) < size:
+            # A few examples hold most of the weight. Fall back to weighted
+            # keys u ** (1 / weight), which needs a pass over the corpus.
+            prev = [0.0] + cum[:-1]
+            chosen = dict.fromkeys(heapq.nlargest(
+                size, range(len(cum)),
+                key=lambda i: random.random() ** (1 / (cum[i] - prev[i]))))
+        return list(chosen)
+
+    def _sample_strata(self, size):
+        """
+        Draws size distinct indices spread over the Poet's strata.
+        """
+        groups, proportional = self._strata
+        counts = [0] * len(groups)
+        if proportional:
+            n = len(self._keys)
+            counts = [size * len(group) // n for group in groups]
+        order = list(range(len(groups)))
+        random.shuffle(order)
+        while sum(counts) < size:
+            grew = False
+            for g in order:
+                if sum(counts) < size and counts[g] < len(groups[g]):
+                    counts[g] += 1
+                    grew = True
+            if not grew:
+                break
+        sample = []
+        for group, count in zip(groups, counts):
+            sample.extend(random.sample(group, count))
+        random.shuffle(sample)
+        return sample
+
+    def pack(self, budget, size=None, knapsack=False, seed=None):
+        """
+        Returns a list of distinct indices into the Poet's corpus keys whose
+        prompt fragments fit in budget tokens.
+
+        Candidates are drawn with select(), so weights, strata and retrieval
+        apply. They are packed greedily in the order drawn, or, if knapsack is
+        True, so as to use as much of the budget as possible.
+
+        Parameter budget: the number of tokens available for examples.
+        Precondition: budget is a non-negative int.
+        Parameter size: the largest number of examples (None for no limit).
+        Precondition: size is a positive int or None.
+        Parameter knapsack: Whether to solve the packing exactly.
+        Precondition: knapsack is a bool.
+        Parameter seed: the seed of the poem, for retrieval.
+        Precondition: seed is a string or None.
+        """
+        n = len(self._keys)
+        draw = int(2 * budget / max(self._mean_tokens, 1)) + 16
+        if size is not None:
+            draw = min(draw, 2 * size + 16)
+        candidates = self.select(min(draw, n), seed)
+        if knapsack:
+            chosen = self._knapsack(candidates, budget)
+        else:
+            chosen = []
+            for i in candidates:
+                if self._tokens[i] <= budget:
+                    chosen.append(i)
+                    budget -= int(self._tokens[i])
+        if size is not None:
+            chosen = chosen[:size]
+        return chosen
+
+    def _knapsack(self, candidates, budget):
+        """
+        Returns the subset of candidates with the largest total number of
+        tokens that fits in budget, by subset sum over int bitsets.
+        """
+        mask = (1 << (budget + 1)) - 1
+        reach = [1]
+        for i in candidates:
+            tokens = int(self._tokens[i])
+            reach.append((reach[-1] | (reach[-1] << tokens)) & mask)
+        total = reach[-1].bit_length() - 1
+        chosen = []
+        for step in range(len(candidates), 0, -1):
+            if not (reach[step - 1] >> total) & 1:
+                i = candidates[step - 1]
+                chosen.append(i)
+                total -= int(self._tokens[i])
+        chosen.reverse()
+        return chosen
 
     @classmethod
     def from_book(cls, header, path, book, keep=True):
@@ -68,24 +330,32 @@ class Poet(object):
         If two Poems have the same label, only the first in the Book will be
         used!
 
+        Parameter path: where to write the corpus. A path ending in ".jsonl"
+        is written line by line as a memory-mapped corpus; if path is None,
+        nothing is written and the Poet keeps its corpus in memory.
+        Precondition: path is a string or None.
         Parameter keep: Whether to keep the original Book as an attribute of the
         Poet.
         """
-        poems = {}
-        for label in book:
-            poem = book.pages[label]
-            text = poem.text
-            poems.update({label: text})
-        json_poems = json.dumps(poems)
-        with open(path, "w") as file:
-            file.write(json_poems)
+        pairs = ((label, book.pages[label].text) for label in book)
+        if path is None:
+            corpus = dict(pairs)
+        elif path.endswith(".jsonl"):
+            store.write(pairs, path)
+            corpus = path
+        else:
+            poems = dict(pairs)
+            json_poems = json.dumps(poems)
+            with open(path, "w") as file:
+                file.write(json_poems)
+            corpus = path
         if keep:
-            new_poet = cls(header, path)
+            new_poet = cls(header, corpus)
             new_poet.book = book
             return new_poet
-        return cls(header, path)
+        return cls(header, corpus)
 
-    def generate(self, size, seed, verbose=False):
+    def generate(self, size, seed, verbose=False, budget=None):
         """
         Returns a poem (with the poem's lines separated by "/") as a string.
 
@@ -96,22 +366,117 @@ class Poet(object):
         Precondition: size is an int less than the size of the corpus.
         Parameter seed: a word used to generate the poem.
         Precondition: seed is a (one or two word) string.
+        Parameter budget: a token budget for the prompt. If not None, examples
+        are packed until the budget is met instead of sampling size of them,
+        and size is the largest number of examples (None for no limit).
+        Precondition: budget is a positive int or None.
         """
-        p = self.build_prompt(size, self.corpus, self.header)
-        response = openai.Completion.create(
-           engine=self.engine,
-           prompt=p + "Seed: " + seed + "\nPoem:",
-           temperature=self.temp,
-           max_tokens=self.max_len,
-           top_p=self.tp,
-           frequency_penalty=self.freq_pen,
-           presence_penalty=self.pres_pen,
-           stop=["###"]
-         )
+        with metrics.span("generate"):
+            p = self.build_prompt(size, self.corpus, self.header,
+                                  budget=budget, seed=seed)
+            text = self._complete(p + "Seed: " + seed + "\nPoem:", seed)
         if verbose:
-            return p + "\nSeed: " + seed + "\nGenerated poem: \n" + \
-                   response.choices[0]["text"]
-        return response.choices[0]["text"]
+            return p + "\nSeed: " + seed + "\nGenerated poem: \n" + text
+        return text
+
+    async def agenerate(self, size, seed, verbose=False, timeout=None,
+                        budget=None):
+        """
+        Returns a poem (with the poem's lines separated by "/") as a string,
+        without blocking the event loop.
+
+        Requests go through the Poet's shared AsyncCompletions client, which
+        limits how many are in flight at once.
+
+        Parameter timeout: the timeout in seconds for the request. If None,
+        the client's timeout is used.
+        Precondition: timeout is a number or None.
+
+        Other parameters are the same as for generate().
+        """
+        with metrics.span("agenerate"):
+            p = self.build_prompt(size, self.corpus, self.header,
+                                  budget=budget, seed=seed)
+            text = await self._acomplete(p + "Seed: " + seed + "\nPoem:",
+                                         seed, timeout=timeout)
+        if verbose:
+            return p + "\nSeed: " + seed + "\nGenerated poem: \n" + text
+        return text
+
+    def _params(self):
+        """
+        Returns a dictionary of the OpenAI sampling parameters of the Poet.
+        """
+        return {"temperature": self.temp, "max_tokens": self.max_len,
+                "top_p": self.tp, "frequency_penalty": self.freq_pen,
+                "presence_penalty": self.pres_pen, "stop": ["###"]}
+
+    def _cache_scope(self):
+        """
+        Returns a digest of the Poet's header and corpus, which seed keys of
+        the cache include.
+        """
+        if self._scope[0] != self.header:
+            data = (self.header + "\n" + self._corpus_digest).encode()
+            self._scope = (self.header, hashlib.sha256(data).hexdigest())
+        return self._scope[1]
+
+    def _complete(self, prompt, seed):
+        """
+        Returns the text of an OpenAI completion of prompt, from the cache if
+        the Poet has one.
+        """
+        if self.cache is None:
+            return self._request(prompt)
+        key = self.cache.key(self.engine, self._params(), seed, prompt,
+                             self._cache_scope())
+        return self.cache.fetch(key, lambda: self._request(prompt))
+
+    def _request(self, prompt):
+        """
+        Returns the text of an OpenAI completion of prompt.
+        """
+        with metrics.span("completion"):
+            response = openai.Completion.create(engine=self.engine,
+                                                prompt=prompt,
+                                                **self._params())
+        text = response.choices[0]["text"]
+        self._observe_completion(text)
+        return text
+
+    @staticmethod
+    def _observe_completion(text):
+        """
+        Records the token count of a completion, if metrics are recorded.
+        """
+        if metrics.REGISTRY.enabled:
+            metrics.observe("basho_completion_tokens", count_tokens(text),
+                            metrics.TOKENS)
+
+    async def _acomplete(self, prompt, seed, timeout=None):
+        """
+        Returns the text of an OpenAI completion of prompt, using the Poet's
+        AsyncCompletions client, from the cache if the Poet has one.
+        """
+        if self.cache is None:
+            return await self._arequest(prompt, timeout)
+        key = self.cache.key(self.engine, self._params(), seed, prompt,
+                             self._cache_scope())
+        return await self.cache.afetch(
+            key, lambda: self._arequest(prompt, timeout))
+
+    async def _arequest(self, prompt, timeout=None):
+        """
+        Returns the text of an OpenAI completion of prompt, using the Poet's
+        AsyncCompletions client.
+        """
+        if self.client is None:
+            self.client = AsyncCompletions()
+        response = await self.client.create(self.engine, prompt,
+                                            timeout=timeout, **self._params())
+        text = response["choices"][0]["text"]
+        self._observe_completion(text)
+        return text
 
     def generate_poem(self, size, seed):
         """
@@ -122,35 +487,132 @@ class Poet(object):
     def generate_book(self, size, seed, author="NaN"):
         """
         """
-        try:
-            keys = self.random_keys(size, self.book)
-            prompt_poems = {}
-            for key in keys:
+        prompt_poems = {}
+        if getattr(self, "book", None) is not None:
+            for key in self.random_keys(size, self.book):
                 prompt_poems.update({key: self.book[key]})
-        except NameError:
-            keys = self.random_keys(size, self.corpus)
-            prompt_poems = {}
-            for key in keys:
+        else:
+            for i in self.select(size, seed):
+                key = self._keys[i]
                 p = Poem(self.corpus[key], author=author)
                 prompt_poems.update({key: p})
-        p = self.header
-        for key, poem in prompt_poems.items():
-            p += "Seed: {}\nPoem: {}\n###\n".format(key, poem.text)
-        ai = openai.Completion.create(
-           engine=self.engine,
-           prompt=p + "Seed: " + seed + "\nPoem:",
-           temperature=self.temp,
-           max_tokens=self.max_len,
-           top_p=self.tp,
-           frequency_penalty=self.freq_pen,
-           presence_penalty=self.pres_pen,
-           stop=["###"]
-         )
-        prompt_poems.update({"%" + seed: Poem(ai.choices[0]["text"],
+        p = self.header + "".join(FRAGMENT.format(key, poem.text)
+                                  for key, poem in prompt_poems.items())
+        text = self._complete(p + "Seed: " + seed + "\nPoem:", seed)
+        prompt_poems.update({"%" + seed: Poem(text,
                                         author="OpenAI", label="%" + seed,
                                         delimiter="/")})
         return Book(prompt_poems)
 
+    def generate_many(self, seeds, size, batch=20, inflight=4, book=False,
+                      budget=None):
+        """
+        Generates a Poem for every seed, packing up to batch prompts into
+        each OpenAI request.
+
+        Returns a generator of (seed, result) pairs in the order requests
+        complete, where result is a Poem, or the Exception raised by the
+        request if it failed. Failed requests do not stop the others. If book
+        is True, returns a Book of the Poems keyed by seed instead, with the
+        failures in its errors attribute.
+
+        Parameter seeds: the seeds of the poems.
+        Precondition: seeds is an iterable of strings (a generator is fine).
+        Parameter size: The number of examples sampled for each prompt.
+        Precondition: size is an int less than the size of the corpus.
+        Parameter batch: the largest number of prompts in one request.
+        Precondition: batch is a positive int.
+        Parameter inflight: the largest number of requests at once.
+        Precondition: inflight is a positive int.
+        Parameter book: Whether to return a Book.
+        Precondition: book is a bool.
+        Parameter budget: a token budget for each prompt, as in generate().
+        Precondition: budget is a positive int or None.
+        """
+        results = self._iter_many(seeds, size, batch, inflight, budget)
+        if not book:
+            return results
+        poems = {}
+        errors = {}
+        for seed, result in results:
+            if isinstance(result, Exception):
+                errors.update({seed: result})
+            else:
+                poems.update({seed: result})
+        return Book(poems, errors=errors)
+
+    def _iter_many(self, seeds, size, batch, inflight, budget):
+        """
+        A generator of (seed, Poem or Exception) pairs for generate_many().
+        """
+        seeds = iter(seeds)
+        with ThreadPoolExecutor(max_workers=inflight) as pool:
+            running = set()
+            exhausted = False
+            while True:
+                while not exhausted and len(running) < inflight:
+                    jobs = []
+                    pulled = 0
+                    for seed in islice(seeds, batch):
+                        pulled += 1
+                        prompt = self.build_prompt(size, self.corpus,
+                                                   self.header, budget=budget,
+                                                   seed=seed)
+                        prompt += "Seed: " + seed + "\nPoem:"
+                        key = None
+                        if self.cache is not None:
+                            key = self.cache.key(self.engine, self._params(),
+                                                 seed, prompt,
+                                                 self._cache_scope())
+                            text = self.cache.get(key)
+                            if text is not None:
+                                self.cache.hits += 1
+                                yield seed, Poem(text, label=seed,
+                                                 author="OpenAI")
+                                continue
+                            self.cache.misses += 1
+                        jobs.append((seed, prompt, key))
+                    if pulled == 0:
+                        exhausted = True
+                    elif jobs:
+                        # A batch of cache hits submits nothing, so keep going
+                        running.add(pool.submit(self._request_many, jobs))
+                if not running:
+                    return
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for seed, result in future.result():
+                        if not isinstance(result, Exception):
+                            result = Poem(result, label=seed, author="OpenAI")
+                        yield seed, result
+
+    def _request_many(self, jobs):
+        """
+        Requests completions for a list of (seed, prompt, cache key) jobs in
+        one OpenAI call, and returns a list of (seed, text or Exception).
+        """
+        try:
+            # One span times the whole batched request
+            with metrics.span("completion"):
+                response = openai.Completion.create(
+                    engine=self.engine, prompt=[job[1] for job in jobs],
+                    **self._params())
+        except Exception as e:
+            return [(job[0], e) for job in jobs]
+        texts = {}
+        for choice in response.choices:
+            texts.update({choice["index"]: choice["text"]})
+        results = []
+        for i, (seed, prompt, key) in enumerate(jobs):
+            if i not in texts:
+                results.append((seed, Exception("No completion returned.")))
+                continue
+            if key is not None:
+                self.cache.put(key, texts[i])
+            self._observe_completion(texts[i])
+            results.append((seed, texts[i]))
+        return results
+
     @staticmethod
     def random_keys(size, dict):
         """
@@ -163,15 +625,10 @@ class Poet(object):
         Precondition: dict is a dictionary of labeled examples which are
         short in length, to reduce financial costs.
         """
-        corpus_keys = list(dict.keys())
-        sample_keys = []
-        while len(sample_keys) < size:
-            key_ix = random.randint(0, len(corpus_keys)-1)
-            if corpus_keys[key_ix] not in sample_keys:
-                sample_keys.append(corpus_keys[key_ix])
-        return sample_keys
+        return random.sample(list(dict), size)
 
-    def build_prompt(self, size, dict, header):
+    def build_prompt(self, size, dict, header, budget=None, knapsack=False,
+                     seed=None):
         """
         Builds a prompt for OpenAI given a corpus of labeled examples.
 
@@ -182,9 +639,49 @@ class Poet(object):
             which are strings (preferably short ones).
         Parameter header: header is a brief description of the poems to be generated.
         Precondition: header is a string (a short one) ending in two trailing "\n".
+        Parameter budget: the number of tokens for the whole prompt. If not
+        None, examples are packed until the budget is met, and size is the
+        largest number of examples (None for no limit).
+        Precondition: budget is a positive int or None.
+        Parameter knapsack: Whether examples are packed exactly, rather than
+        greedily, when a budget is given.
+        Precondition: knapsack is a bool.
+        Parameter seed: the seed of the poem. If the Poet retrieves examples
+        (see retrieve()), the ones most related to seed are used.
+        Precondition: seed is a string or None.
         """
-        sample_keys = self.random_keys(size, dict)
-        prompt = header
-        for key in sample_keys:
-            prompt += "Seed: {}\nPoem: {}\n###\n".format(key, dict[key])
+        # Prompts are only measured when metrics are recorded
+        measured = metrics.REGISTRY.enabled
+        with metrics.span("build_prompt"):
+            if dict is not self.corpus:
+                if budget is not None:
+                    raise Exception("Token budgets need the Poet's own "
+                                    "corpus.")
+                prompt = header + "".join(
+                    FRAGMENT.format(key, dict[key])
+                    for key in self.random_keys(size, dict))
+                if measured:
+                    tokens = count_tokens(prompt)
+            else:
+                if budget is not None:
+                    indices = self.pack(
+                        max(budget - self._count_header(header), 0), size,
+                        knapsack=knapsack, seed=seed)
+                else:
+                    indices = self.select(size, seed)
+                prompt = header + "".join(self._fragments[i] for i in indices)
+                if measured:
+                    # Fragment token counts are precomputed by _index_corpus()
+                    tokens = self._count_header(header) + int(
+                        sum(self._tokens[i] for i in indices))
+        if measured:
+            metrics.observe("basho_prompt_tokens", tokens, metrics.TOKENS)
         return prompt
+
+    def _count_header(self, header):
+        """
+        Returns the token count of header, counted once per header.
+        """
+        if self._header_tokens[0] != header:
+            self._header_tokens = (header, count_tokens(header))
+        return self._header_tokens[1]
@@ -0,0 +1,148 @@
+"""
+Seed-aware retrieval of prompt examples for Poets.
+
+ExampleIndex is an inverted index over the labels and texts of a corpus, built
+once. Given a seed, it scores only the examples that share a term with the
+seed (idf-weighted, with label matches counting most), so a query takes time
+proportional to the matching postings rather than to the corpus. Optionally,
+terms are expanded with the WordNet hypernyms of their words from a SynCache,
+the same lookups SynGraph uses, so "heron" also finds examples about other
+birds. When fewer than k examples match, the rest are sampled at random.
+"""
+import math
+import random
+import re
+import numpy as np
+from basho.src.syncache import get_cache
+
+# How much a match counts in each field of an example
+KEY = 3.0
+TEXT = 1.0
+SYN = 0.5
+
+
+def terms(text, regex=r"\W+"):
+    """
+    Returns the list of words of a label, seed or poem text.
+
+    Parameter text: the text.
+    Precondition: text is a string, with lines separated by "/".
+    Parameter regex: removed from every word.
+    Precondition: regex is a valid regular expression.
+    """
+    words = (re.sub(regex, "", word) for word in
+             text.replace("/", " ").lower().split())
+    return [word for word in words if word != ""]
+
+
+class ExampleIndex(object):
+    """
+    An inverted index of (label, text) examples for top-k retrieval by seed.
+    """
+
+    def __init__(self, keys, texts, syns=False, hyp=True, cache=None):
+        """
+        Initializer for the ExampleIndex class.
+
+        Parameter keys: the labels of the examples.
+        Precondition: keys is a sequence of strings.
+        Parameter texts: the texts of the examples, in the same order.
+        Precondition: texts is an iterable of strings (a generator is fine).
+        Parameter syns: Whether terms are expanded with WordNet hypernyms (or
+        hyponyms, if hyp is False).
+        Precondition: syns is a bool.
+        Parameter cache: the cache of WordNet lookups (None for the shared
+        cache).
+        Precondition: cache is a SynCache or None.
+        """
+        self.syns = syns
+        self.hyp = hyp
+        self.size = len(keys)
+        self._cache = None
+        if syns:
+            self._cache = cache if cache is not None else get_cache()
+        postings = {}
+        for i, (key, text) in enumerate(zip(keys, texts)):
+            for term in self._expand(terms(key), KEY):
+                postings.setdefault(term, []).append(i)
+            for term in self._expand(terms(text), TEXT):
+                postings.setdefault(term, []).append(i)
+        self._postings = {}
+        for term, ids in postings.items():
+            # A document is listed once per term, however often it matches
+            ids = np.unique(np.asarray(ids, dtype=np.int32))
+            weight = term[0] * math.log(1 + self.size / len(ids))
+            self._postings[term] = (ids, weight)
+        if self._cache is not None:
+            self._cache.flush()
+
+    def _expand(self, words, field):
+        """
+        Returns the set of (field weight, kind, term) triples of words.
+        """
+        found = {(field, "w", word) for word in words}
+        if self._cache is not None:
+            for word in set(words):
+                found.update((SYN, "s", nym)
+                             for nym in self._cache.nyms(word, self.hyp))
+        return found
+
+    def scores(self, seed):
+        """
+        Returns a tuple (ids, scores) of the examples that match seed and
+        their scores, as NumPy arrays.
+
+        Parameter seed: the seed of a poem.
+        Precondition: seed is a string.
+        """
+        words = terms(seed)
+        query = {("w", word) for word in words}
+        if self._cache is not None:
+            for word in words:
+                query.update(("s", nym)
+                             for nym in self._cache.nyms(word, self.hyp))
+        ids = []
+        weights = []
+        for term in query:
+            # A word can match in the label and in the text
+            for field in (KEY, TEXT, SYN):
+                entry = self._postings.get((field,) + term)
+                if entry is not None:
+                    ids.append(entry[0])
+                    weights.append(np.full(len(entry[0]), entry[1]))
+        if not ids:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        found, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        return found, np.bincount(inverse, np.concatenate(weights))
+
+    def top(self, seed, k, fill=True, rng=random):
+        """
+        Returns a list of k distinct example indices, the best matches for
+        seed first. Ties are broken at random, and if fewer than k examples
+        match, the rest are sampled uniformly (or left out if fill is False).
+
+        Parameter seed: the seed of a poem.
+        Precondition: seed is a string.
+        Parameter k: the number of examples.
+        Precondition: k is an int, where 0 <= k <= the number of examples.
+        Parameter fill: Whether to fill up to k examples with random ones.
+        Precondition: fill is a bool.
+        Parameter rng: the source of randomness.
+        Precondition: rng is a random.Random (or the random module).
+        """
+        found, scores = self.scores(seed)
+        if len(found):
+            noise = np.random.default_rng(rng.getrandbits(32)).random(
+                len(found))
+            order = np.lexsort((noise, -scores))[:k]
+            chosen = found[order].tolist()
+        else:
+            chosen = []
+        if fill and len(chosen) < k:
+            taken = set(chosen)
+            while len(chosen) < k:
+                i = rng.randrange(self.size)
+                if i not in taken:
+                    taken.add(i)
+                    chosen.append(i)
+        return chosen
@@ -0,0 +1,298 @@
+"""
+An approximate nearest-neighbor index of Poems.
+
+Every Poem is reduced to a set of shingles (its word n-grams, and optionally
+the WordNet hypernyms of its words), and the set to a MinHash signature, whose
+positions agree between two Poems with probability equal to the Jaccard
+similarity of their shingle sets. Signatures are cut into bands, and Poems that
+share any whole band land in the same bucket, so a query only looks at the
+Poems it shares a bucket with instead of the whole Book. Candidates are ranked
+by estimated Jaccard distance, or re-ranked exactly with a textdistance
+algorithm.
+"""
+import hashlib
+import json
+import re
+import numpy as np
+import textdistance as td
+from basho.src.poem import Poem
+from basho.src.syncache import get_cache
+
+# The universal hash functions of the signatures are (a * x + b) mod PRIME,
+# for a in [1, PRIME), b in [0, PRIME) and 32 bit shingle hashes x, computed
+# exactly in 64 bits (see _universal())
+PRIME = (1 << 61) - 1
+MAX_HASH = np.uint64(0xFFFFFFFF)
+
+# The version of the hash functions, stored by save(), since signatures made
+# by other versions cannot be compared
+VERSION = 2
+
+
+def _words(item):
+    """
+    Returns the words of a Poem, or of a text as a Poem would split it.
+    """
+    if isinstance(item, str):
+        item = Poem(item)
+    return item.get_words()
+
+
+def _hash(shingle):
+    """
+    Returns a stable 32 bit hash of a shingle.
+    """
+    digest = hashlib.blake2b(shingle.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _mod(values):
+    """
+    Returns values mod PRIME, for uint64 values below 2 ** 63.
+    """
+    p = np.uint64(PRIME)
+    values = (values & p) + (values >> np.uint64(61))
+    return np.where(values >= p, values - p, values)
+
+
+def _universal(x, a, b):
+    """
+    Returns the len(x) x len(a) uint64 array of (a * x + b) mod PRIME.
+
+    a * x needs up to 93 bits, so a is split into its low 32 bits and high
+    29 bits, and 2 ** 61 = 1 (mod PRIME) folds the high product back in.
+
+    Parameter x: the shingle hashes.
+    Precondition: x is a uint64 array of values below 2 ** 32.
+    Parameter a, b: the coefficients of the hash functions.
+    Precondition: a and b are uint64 arrays of values below PRIME.
+    """
+    low = np.outer(x, a & MAX_HASH)
+    high = np.outer(x, a >> np.uint64(32))
+    # high * 2 ** 32 = (high mod 2 ** 29) * 2 ** 32 + (high >> 29) * 2 ** 61
+    shifted = (((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+               + (high >> np.uint64(29)))
+    return _mod(_mod(low) + _mod(shifted) + b)
+
+
+class SimIndex(object):
+    """
+    A MinHash/LSH index of Poems for top-k similarity queries.
+    """
+
+    def __init__(self, num_perm=128, bands=32, shingle=1, syns=False,
+                 seed=1, regex=r"\W+"):
+        """
+        Initializer for the SimIndex class.
+
+        Parameter num_perm: the length of the MinHash signatures. Longer
+        signatures estimate similarity more precisely.
+        Precondition: num_perm is a positive int.
+        Parameter bands: the number of LSH bands. More bands find less similar
+        Poems, at the cost of more candidates.
+        Precondition: bands is a positive int dividing num_perm.
+        Parameter shingle: the number of consecutive words in a shingle.
+        Precondition: shingle is a positive int.
+        Parameter syns: Whether the hypernyms of a Poem's words (from the
+        shared SynCache) are added to its shingles.
+        Precondition: syns is a bool.
+        Parameter seed: the seed of the hash functions. Indexes can only be
+        compared or merged if their seeds match.
+        Precondition: seed is an int.
+        Parameter regex: removed from every word before shingling.
+        Precondition: regex is a valid regular expression.
+        """
+        if num_perm % bands:
+            raise Exception("bands must divide num_perm.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle = shingle
+        self.syns = syns
+        self.seed = seed
+        self.regex = regex
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, PRIME, size=num_perm, dtype=np.uint64)
+        # key -> row of its signature, and row -> key
+        self._rows = {}
+        self._keys = []
+        self._signatures = np.zeros((16, num_perm), dtype=np.uint32)
+        self._buckets = [{} for band in range(bands)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def shingles(self, item):
+        """
+        Returns the set of shingles of a Poem or text.
+
+        Parameter item: the Poem or text.
+        Precondition: item has get_words(), or is a string.
+        """
+        words = [w for w in (re.sub(self.regex, "", word)
+                             for word in _words(item)) if w != ""]
+        n = self.shingle
+        shingles = {" ".join(words[i:i + n])
+                    for i in range(max(len(words) - n + 1, 0))}
+        if self.syns:
+            cache = get_cache()
+            for word in set(words):
+                shingles.update("syn:" + nym for nym in cache.nyms(word))
+        return shingles
+
+    def signature(self, item):
+        """
+        Returns the MinHash signature of a Poem or text, as a uint32 array.
+
+        Parameter item: the Poem or text.
+        Precondition: item has get_words(), or is a string.
+        """
+        hashes = np.fromiter((_hash(s) for s in self.shingles(item)),
+                             dtype=np.uint64)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        values = _universal(hashes, self._a, self._b)
+        return (values & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature):
+        """
+        Returns the bucket key of every band of a signature.
+        """
+        return [band.tobytes()
+                for band in signature.reshape(self.bands, -1)]
+
+    def add(self, key, item):
+        """
+        Adds a Poem or text to the index under key, replacing any earlier
+        entry for key.
+
+        Parameter key: the key of the Poem, e.g. its key in a Book.
+        Precondition: key is json serializable and hashable.
+        Parameter item: the Poem or text.
+        Precondition: item has get_words(), or is a string.
+        """
+        self._insert(key, self.signature(item))
+
+    def _insert(self, key, signature):
+        """
+        Stores a signature under key and puts key in its buckets.
+        """
+        if key in self._rows:
+            self.remove(key)
+        row = len(self._keys)
+        if row == len(self._signatures):
+            bigger = np.zeros((2 * row, self.num_perm), dtype=np.uint32)
+            bigger[:row] = self._signatures
+            self._signatures = bigger
+        self._signatures[row] = signature
+        self._keys.append(key)
+        self._rows[key] = row
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            buckets.setdefault(band, []).append(key)
+
+    def remove(self, key):
+        """
+        Removes key from the index. The last signature row is moved into
+        its row, so the rows stay compact.
+        """
+        row = self._rows.pop(key)
+        for buckets, band in zip(self._buckets,
+                                 self._bands(self._signatures[row])):
+            bucket = buckets[band]
+            bucket.remove(key)
+            if not bucket:
+                del buckets[band]
+        last = len(self._keys) - 1
+        if row != last:
+            moved = self._keys[last]
+            self._signatures[row] = self._signatures[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+        self._keys.pop()
+
+    def candidates(self, signature):
+        """
+        Returns the keys that share at least one band with signature.
+        """
+        found = {}
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            for key in buckets.get(band, ()):
+                found[key] = None
+        return list(found)
+
+    def query(self, item, k=10, rerank=None, pages=None, exclude=None):
+        """
+        Returns a list of up to k (key, distance) pairs of the Poems most
+        similar to item, closest first.
+
+        Without rerank, distance is the Jaccard distance of the shingle sets
+        estimated from the signatures. With rerank, it is the normalized
+        textdistance between the words of item and those of each candidate.
+
+        Parameter item: the Poem or text.
+        Precondition: item has get_words(), or is a string.
+        Parameter k: the number of Poems to return.
+        Precondition: k is a positive int.
+        Parameter rerank: the name of a textdistance algorithm, or None.
+        Precondition: rerank is a string or None.
+        Parameter pages: the indexed Poems by key, for re-ranking.
+        Precondition: pages is a dictionary of Poems, or None if rerank is.
+        Parameter exclude: a key to leave out, e.g. the key of item itself.
+        Precondition: exclude is a key or None.
+        """
+        signature = self.signature(item)
+        keys = [key for key in self.candidates(signature) if key != exclude]
+        if not keys:
+            return []
+        if rerank is not None:
+            alg = getattr(td, rerank)
+            words = _words(item)
+            scores = [alg.normalized_distance(words, pages[key].get_words())
+                      for key in keys]
+        else:
+            rows = self._signatures[[self._rows[key] for key in keys]]
+            scores = 1.0 - (rows == signature).mean(axis=1)
+            scores = scores.tolist()
+        order = sorted(range(len(keys)), key=lambda i: (scores[i], i))
+        return [(keys[i], scores[i]) for i in order[:k]]
+
+    def save(self, path):
+        """
+        Writes the index to path (a .npz file), from which load() rebuilds
+        it without rehashing any Poem.
+
+        Parameter path: the filename or path.
+        Precondition: path is a string ending in ".npz".
+        """
+        options = {"num_perm": self.num_perm, "bands": self.bands,
+                   "shingle": self.shingle, "syns": self.syns,
+                   "seed": self.seed, "regex": self.regex}
+        np.savez(path, signatures=self._signatures[:len(self._keys)],
+                 keys=np.array(json.dumps(self._keys)),
+                 options=np.array(json.dumps(options)),
+                 version=np.array(VERSION))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the index saved to path by save().
+
+        Parameter path: the filename or path.
+        Precondition: path is a string.
+        """
+        with np.load(path) as data:
+            if "version" not in data or int(data["version"]) != VERSION:
+                raise Exception("The index was saved with other hash "
+                                "functions. Build it again.")
+            options = json.loads(str(data["options"]))
+            keys = json.loads(str(data["keys"]))
+            signatures = data["signatures"]
+        index = cls(**options)
+        for key, signature in zip(keys, signatures):
+            if isinstance(key, list):
+                key = tuple(key)
+            index._insert(key, signature)
+        return index
@@ -0,0 +1,235 @@
+"""
+Local stand-ins for the http apis used by basho.
+
+StubServer answers POST /engines/<engine>/completions (and /completions) in
+the shape of the OpenAI api, so Poet can be exercised without network access or
+cost. PoetryDBStub answers PoetryDB queries from a list of poems, for
+PdbWrangler. GET responses carry an ETag and honor If-None-Match. Both run in
+a background thread:
+
+    with StubServer(text=lambda prompt: " a poem/of lines\\n") as stub:
+        client = AsyncCompletions(api_base=stub.url)
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+import hashlib
+import json
+import random
+import threading
+import time
+
+
+class StubServer(object):
+    """
+    A threaded http server that serves canned completions.
+    """
+
+    def __init__(self, text=None, delay=0.0, status=200, port=0, fail=0):
+        """
+        Initializer for the StubServer class.
+
+        Parameter text: a function from a prompt to the completion text. If
+        None, every completion is " an old pond/a frog/splash\\n".
+        Precondition: text is a function or None.
+        Parameter delay: the number of seconds to wait before answering.
+        Precondition: delay is a number.
+        Parameter status: the http status of every response.
+        Precondition: status is an int.
+        Parameter port: the port to listen on (0 picks a free one).
+        Precondition: port is an int.
+        Parameter fail: the number of requests answered with a 503 before the
+        stub starts answering normally, to exercise retries.
+        Precondition: fail is an int.
+        """
+        self.text = text or (lambda prompt: " an old pond/a frog/splash\n")
+        self.delay = delay
+        self.status = status
+        self.fail = fail
+        self.requests = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        The base url of the stub, to be used as an api_base.
+        """
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def complete(self, body):
+        """
+        Returns the json response for a completion request body.
+        """
+        prompts = body.get("prompt", "")
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        choices = [{"text": self.text(prompt), "index": i,
+                    "finish_reason": "stop"}
+                   for i, prompt in enumerate(prompts)]
+        return {"object": "text_completion", "model": body.get("model"),
+                "choices": choices}
+
+    def get(self, path):
+        """
+        Returns a tuple (status, data) for a GET request of path.
+        """
+        return 404, {"status": 404, "reason": "Not found"}
+
+    def _status(self):
+        """
+        Returns the status the next response should have.
+        """
+        if self.fail > 0:
+            self.fail -= 1
+            return 503
+        return self.status
+
+    def _handler(self):
+        """
+        Returns a request handler class bound to this stub.
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests.append((self.path, body))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status = stub._status()
+                if status != 200:
+                    self._send(status, {"error": {"message": "stub"}})
+                else:
+                    self._send(200, stub.complete(body))
+
+            def do_GET(self):
+                stub.requests.append((self.path, None))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status = stub._status()
+                if status != 200:
+                    self._send(status, {"error": {"message": "stub"}})
+                    return
+                status, data = stub.get(unquote(self.path))
+                etag = '"{}"'.format(hashlib.sha1(
+                    json.dumps(data).encode()).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                else:
+                    self._send(status, data, etag)
+
+            def _send(self, status, data, etag=None):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up, e.g. after a timeout
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# PoetryDB answers searches without results with a 200 and this object
+NOT_FOUND = {"status": 404, "reason": "Not found"}
+
+
+class PoetryDBStub(StubServer):
+    """
+    A stand-in for poetrydb.org that serves a list of poems.
+    """
+
+    def __init__(self, poems, **kwargs):
+        """
+        Parameter poems: the poems to serve.
+        Precondition: poems is a list of dictionaries with "title", "author",
+        "lines" and "linecount" keys, as returned by PoetryDB.
+
+        Additional keyword arguments are passed to StubServer.
+        """
+        super(PoetryDBStub, self).__init__(**kwargs)
+        self.poems = poems
+
+    def get(self, path):
+        """
+        Returns a tuple (status, data) for a PoetryDB query.
+        """
+        parts = [part for part in path.split("/") if part]
+        if parts == ["author"]:
+            authors = sorted({poem["author"] for poem in self.poems})
+            return 200, {"authors": authors}
+        if len(parts) == 2 and parts[0] == "random":
+            count = min(int(parts[1]), len(self.poems))
+            return 200, random.sample(self.poems, count)
+        if len(parts) < 2:
+            return 200, NOT_FOUND
+        fields = parts[0].split(",")
+        terms = parts[1].split(";")
+        found = self.poems
+        count = None
+        for field, term in zip(fields, terms):
+            exact = term.endswith(":abs")
+            if exact:
+                term = term[:-len(":abs")]
+            if field == "poemcount":
+                count = int(term)
+            else:
+                found = [poem for poem in found
+                         if _matches(poem, field, term, exact)]
+        if count is not None:
+            found = found[:count]
+        if not found:
+            return 200, NOT_FOUND
+        return 200, found
+
+
+def _matches(poem, field, term, exact):
+    """
+    Returns True if a poem matches a PoetryDB search term for field.
+    """
+    if field == "linecount":
+        return int(poem["linecount"]) == int(term)
+    if field == "lines":
+        values = poem["lines"]
+    else:
+        values = [poem[field]]
+    if exact:
+        return any(value == term for value in values)
+    return any(term.lower() in value.lower() for value in values)
@@ -0,0 +1,214 @@
+"""
+A cache for WordNet lookups used by SynGraph.
+
+For every word, the cache stores the names of its synsets and the names of the
+hypernyms and hyponyms of those synsets. Entries live in an in-memory LRU and,
+optionally, in a sqlite file, so WordNet is only loaded for words that have
+never been seen before.
+"""
+from collections import OrderedDict
+import re
+import sqlite3
+
+# The cache shared by every SynGraph that is not given one explicitly
+_default = None
+
+
+class SynCache(object):
+    """
+    A word -> (synsets, hypernyms, hyponyms) cache of WordNet synset names.
+    """
+
+    def __init__(self, path=None, size=100000, commit=1000):
+        """
+        Initializer for the SynCache class.
+
+        Parameter path: a sqlite file in which to persist entries. If None,
+        entries are only kept in memory.
+        Precondition: path is a string or None.
+        Parameter size: the maximum number of entries kept in memory.
+        Precondition: size is a positive int.
+        Parameter commit: the number of new entries written to path between
+        commits.
+        Precondition: commit is a positive int.
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._commit = commit
+        self._memory = OrderedDict()
+        self._pending = []
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS syns (word TEXT "
+                             "PRIMARY KEY, synsets TEXT, hypernyms TEXT, "
+                             "hyponyms TEXT)")
+
+    def lookup(self, word):
+        """
+        Returns a tuple (synsets, hypernyms, hyponyms) of tuples of synset
+        names for word.
+
+        Hypernyms and hyponyms are those of all of the word's synsets, in
+        WordNet's order. A name shared by several synsets is repeated, as
+        SynGraph labels an edge with the last synset its words share.
+
+        Parameter word: the word to look up.
+        Precondition: word is a string.
+        """
+        entry = self._memory.get(word)
+        if entry is not None:
+            self._memory.move_to_end(word)
+            self.hits += 1
+            return entry
+        entry = self._read(word)
+        if entry is None:
+            self.misses += 1
+            entry = self._from_wordnet(word)
+            self._write(word, entry)
+        else:
+            self.hits += 1
+        self._remember(word, entry)
+        return entry
+
+    def nyms(self, word, hyp=True):
+        """
+        Returns the hypernym names (hyp is True) or hyponym names (hyp is
+        False) of all of word's synsets.
+        """
+        entry = self.lookup(word)
+        if hyp:
+            return entry[1]
+        return entry[2]
+
+    def warm(self, words):
+        """
+        Looks up every word in words, so later lookups are hits.
+
+        Parameter words: the words to look up.
+        Precondition: words is an iterable of strings.
+        """
+        for word in words:
+            self.lookup(word)
+        self.flush()
+
+    def warm_book(self, book, regex=r"\W+"):
+        """
+        Looks up every word of every Poem in a Book.
+
+        Parameter book: the Book to warm the cache from.
+        Precondition: book is a Book of Poems.
+        Parameter regex: the regular expression SynGraph applies to words.
+        Precondition: regex is a valid regular expression.
+        """
+        words = set()
+        for key in book:
+            for word in book[key].get_words():
+                words.add(re.sub(regex, "", word))
+        words.discard("")
+        self.warm(words)
+
+    def entries(self, words):
+        """
+        Returns a dictionary of {word: (synsets, hypernyms, hyponyms)} for
+        words, e.g. to send to a worker process.
+
+        Parameter words: the words to look up.
+        Precondition: words is an iterable of strings.
+        """
+        return {word: self.lookup(word) for word in words}
+
+    def update(self, entries):
+        """
+        Puts entries returned by entries() in the in-memory LRU, without
+        writing them to the sqlite file.
+
+        Parameter entries: the entries to add.
+        Precondition: entries is a dictionary of {word: entry} pairs.
+        """
+        for word, entry in entries.items():
+            self._remember(word, entry)
+
+    def flush(self):
+        """
+        Commits pending entries to the sqlite file.
+        """
+        if self._db is not None and self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO syns VALUES "
+                                 "(?, ?, ?, ?)", self._pending)
+            self._db.commit()
+        self._pending = []
+
+    def close(self):
+        """
+        Commits pending entries and closes the sqlite file.
+        """
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, word, entry):
+        """
+        Puts an entry in the in-memory LRU.
+        """
+        self._memory[word] = entry
+        if len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+    def _read(self, word):
+        """
+        Returns the entry for word in the sqlite file, or None.
+        """
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT synsets, hypernyms, hyponyms FROM "
+                               "syns WHERE word = ?", (word,)).fetchone()
+        if row is None:
+            return None
+        return tuple(tuple(names.split()) for names in row)
+
+    def _write(self, word, entry):
+        """
+        Queues an entry to be written to the sqlite file.
+        """
+        if self._db is None:
+            return
+        self._pending.append((word,) + tuple(" ".join(names)
+                                             for names in entry))
+        if len(self._pending) >= self._commit:
+            self.flush()
+
+    @staticmethod
+    def _from_wordnet(word):
+        """
+        Returns the entry for word computed from WordNet.
+        """
+        from nltk.corpus import wordnet as wn
+        syns = wn.synsets(word)
+        # Duplicates are kept, so edges get the synsets they got from WordNet
+        hyper = tuple(nym.name() for syn in syns for nym in syn.hypernyms())
+        hypo = tuple(nym.name() for syn in syns for nym in syn.hyponyms())
+        return (tuple(syn.name() for syn in syns), hyper, hypo)
+
+
+def get_cache():
+    """
+    Returns the shared SynCache, creating an in-memory one if needed.
+    """
+    global _default
+    if _default is None:
+        _default = SynCache()
+    return _default
+
+
+def set_cache(cache):
+    """
+    Replaces the shared SynCache, e.g. with one persisted to disk.
+
+    Parameter cache: the new shared cache.
+    Precondition: cache is a SynCache.
+    """
+    global _default
+    _default = cache
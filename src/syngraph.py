@@ -1,5 +1,8 @@
 from basho.src.bgraph import bGraph
-from nltk.corpus import wordnet as wn
+from basho.src.syncache import get_cache
+from collections import Counter
+from itertools import combinations
+import numpy as np
 import re
 
 
@@ -10,7 +13,8 @@ class SynGraph(bGraph):
     hypo/hypernyms.
     """
 
-    def __init__(self, text, hyp=True, regex=r"\W+"):
+    def __init__(self, text, hyp=True, regex=r"\W+", cache=None,
+                 index=False, hub=None, cap=False):
         """
         Initializer for the SynGraph class.
 
@@ -22,9 +26,27 @@ class SynGraph(bGraph):
         Poem's words.
         Precondition: regex is a valid regular expression or function to be
         passed to re.sub().
+        Parameter cache: the cache of WordNet lookups. If None, the shared
+        cache from syncache.get_cache() is used.
+        Precondition: cache is a SynCache or None.
+        Parameter index: Whether to build the graph from a synset -> words
+        index in one pass. Edges then carry every shared synset in the
+        "synsets" attribute, instead of only the last one in "synset".
+        Precondition: index is a bool.
+        Parameter hub: In index mode, the largest number of words a synset
+        may connect. Larger synsets (e.g. entity.n.01) are skipped, or capped
+        to their first hub words if cap is True. If None, no limit.
+        Precondition: hub is a positive int or None.
+        Parameter cap: Whether hubs are capped (True) or skipped (False).
+        Precondition: cap is a bool.
         """
         super(SynGraph, self).__init__()
+        if cache is None:
+            cache = get_cache()
         self._syn_word = {}
+        if index:
+            self._index_adder(text, hyp, regex, cache, hub, cap)
+            return
         for word in text:
             # Remove non-alphanumeric chars from words except for those
             # specified in nonalpha.
@@ -33,13 +55,12 @@ class SynGraph(bGraph):
             # For non-empty words, add all synsets associated with the word
             # to the graph _g. For duplicate synsets, update occurrences.
             if w != '':
-                syns = wn.synsets(w)
+                nyms = cache.nyms(w, hyp)
                 if w not in self._g:
                     self._g.add_node(w, occurrences=1)
                 else:
                     self._g.nodes[w]["occurrences"] += 1
-                for syn in syns:
-                    self._hyp_adder(syn, w, self._g, self._syn_word, hyp)
+                self._hyp_adder(nyms, w, self._g, self._syn_word)
 
     @classmethod
     def from_poem(cls, poem, **kwargs):
@@ -49,29 +70,93 @@ class SynGraph(bGraph):
         text = poem.get_words()
         return cls(text, **kwargs)
 
-    def _hyp_adder(self, syn, word, graph, dict, h):
+    def _hyp_adder(self, nyms, word, graph, dict):
         """
         A helper function for the initializer.
 
-        h is True for hypernyms, False for hyponyms.
+        nyms are the names of the hypernyms or hyponyms of word's synsets.
         """
-        if h:
-            hy = syn.hypernyms()
-        else:
-            hy = syn.hyponyms()
-        for nym in hy:
+        for nym in nyms:
             if nym not in dict:
                 dict.update({nym: {word}})
             else:
                 others = dict[nym]
                 for other in others:
                     if other != word:
-                        graph.add_edge(word, other, synset=nym.name())
+                        graph.add_edge(word, other, synset=nym)
                 dict[nym].add(word)
 
+    def _index_adder(self, text, hyp, regex, cache, hub, cap):
+        """
+        A helper function for the initializer that builds the graph from a
+        synset -> words index.
+
+        Each pair of words is connected once, with all of the synsets they
+        share, so the work is proportional to the number of edges rather than
+        to the number of word occurrences.
+        """
+        occurrences = Counter()
+        index = {}
+        for word in text:
+            w = re.sub(regex, "", word)
+            if w != '':
+                occurrences[w] += 1
+                if occurrences[w] == 1:
+                    for nym in cache.nyms(w, hyp):
+                        index.setdefault(nym, {})[w] = None
+        self._g.add_nodes_from((w, {"occurrences": count})
+                               for w, count in occurrences.items())
+        shared = {}
+        for nym, words in index.items():
+            words = list(words)
+            self._syn_word.update({nym: set(words)})
+            if hub is not None and len(words) > hub:
+                if not cap:
+                    continue
+                words = words[:hub]
+            for pair in combinations(words, 2):
+                shared.setdefault(pair, []).append(nym)
+        self._g.add_edges_from((u, v, {"synset": nyms[-1],
+                                       "synsets": tuple(nyms)})
+                               for (u, v), nyms in shared.items())
+
+    def to_arrays(self):
+        """
+        The same as bGraph.to_arrays(), with "syns", a dictionary of
+        {synset name: array of node numbers} for get_syn_names().
+        """
+        arrays = super(SynGraph, self).to_arrays()
+        ids = {node: i for i, node in enumerate(arrays["nodes"])}
+        arrays["syns"] = {nym: np.array([ids[w] for w in words],
+                                        dtype=np.int32)
+                          for nym, words in self._syn_word.items()}
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, lazy=False):
+        """
+        The same as bGraph.from_arrays(), restoring get_syns() and
+        get_syn_names().
+        """
+        graph = super(SynGraph, cls).from_arrays(arrays, lazy)
+        nodes = arrays["nodes"]
+        graph._syn_word = {nym: {nodes[i] for i in ids.tolist()}
+                           for nym, ids in arrays.get("syns", {}).items()}
+        return graph
+
     def get_syns(self):
         """
-        Returns a dictionary of {synset: [word]} pairs for the SynGraph.
+        Returns a dictionary of {synset: {word}} pairs for the SynGraph, where
+        synset is a WordNet Synset. Synsets are looked up by name, so WordNet
+        is loaded on the first call; get_syn_names() does not need it.
+        """
+        from nltk.corpus import wordnet as wn
+        return {wn.synset(name): words
+                for name, words in self._syn_word.items()}
+
+    def get_syn_names(self):
+        """
+        Returns a dictionary of {synset name: {word}} pairs for the SynGraph.
         """
         return self._syn_word
 
@@ -83,7 +168,7 @@ class SynGraph(bGraph):
         """
         syn_counts = {}
         for key, value in self._syn_word.items():
-            syn_counts.update({key.name(): [len(value)]})
+            syn_counts.update({key: [len(value)]})
         return syn_counts
 
     def get_syn_frac(self):
@@ -96,5 +181,5 @@ class SynGraph(bGraph):
         syn_counts = {}
         for key, value in self._syn_word.items():
             frac = len(value)/self.get_num_edges()
-            syn_counts.update({key.name(): [frac]})
+            syn_counts.update({key: [frac]})
         return syn_counts
@@ -0,0 +1,44 @@
+"""
+Tests for the completion cache keys of Poets.
+"""
+from basho.src.completioncache import CompletionCache
+from basho.src.poet import Poet
+
+CORPUS = {"pond": "an old pond/a frog jumps in/the sound of water",
+          "crow": "on a withered branch/a crow has settled/autumn nightfall",
+          "moon": "the moon/a finger pointing/at it"}
+
+
+def _poet(header, cache, corpus=CORPUS):
+    poet = Poet(header, corpus, cache=cache)
+    # Every Poet answers with its own header, without calling OpenAI
+    poet._request = lambda prompt: " " + header + "\n"
+    return poet
+
+
+def test_seed_keys_differ_by_header():
+    cache = CompletionCache()
+    haiku = _poet("Writes haikus", cache)
+    senryu = _poet("Writes senryus", cache)
+    assert haiku.generate(2, "frog") == " Writes haikus\n"
+    assert senryu.generate(2, "frog") == " Writes senryus\n"
+    assert cache.misses == 2
+
+
+def test_seed_keys_differ_by_corpus():
+    cache = CompletionCache()
+    first = _poet("Writes haikus", cache)
+    other = dict(CORPUS, heron="a heron/in the evening rain/standing still")
+    second = _poet("Writes haikus", cache, other)
+    second._request = lambda prompt: " other\n"
+    assert first.generate(2, "frog") == " Writes haikus\n"
+    assert second.generate(2, "frog") == " other\n"
+
+
+def test_seed_keys_shared_by_same_poet():
+    cache = CompletionCache()
+    poet = _poet("Writes haikus", cache)
+    poet.generate(2, "frog")
+    poet._request = lambda prompt: " changed\n"
+    assert poet.generate(2, "frog") == " Writes haikus\n"
+    assert cache.hits == 1